@@ -0,0 +1,72 @@
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from cache import cached_sat, open_cache
+from tableau import parse, proposition_tree
+from truthtable import tree_mask
+
+
+def check(fmla):
+    if not parse(fmla):
+        return None
+    return cached_sat(fmla)
+
+
+def apply_chunk(func, items):
+    return [func(item) for item in items]
+
+
+def chunks(items, size):
+    items = iter(items)
+    chunk = list(islice(items, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(items, size))
+
+
+# Applies func to every item and yields the results in input order. At most a
+# couple of chunks per worker are in flight, so the input is read lazily and memory
+# stays flat however long it is. func must be picklable, e.g. a module-level function.
+# initializer(*initargs) runs once in each worker, or in this process when
+# processes is 1.
+def imap_ordered(func, items, processes=None, chunksize=64, initializer=None, initargs=()):
+    if processes == 1:
+        if initializer is not None:
+            initializer(*initargs)
+        for item in items:
+            yield func(item)
+        return
+
+    processes = processes or os.cpu_count() or 1
+    with ProcessPoolExecutor(processes, initializer=initializer, initargs=initargs) as pool:
+        in_flight = deque()
+        for chunk in chunks(items, chunksize):
+            in_flight.append(pool.submit(apply_chunk, func, chunk))
+            if len(in_flight) >= 2 * processes:
+                yield from in_flight.popleft().result()
+        while in_flight:
+            yield from in_flight.popleft().result()
+
+
+# Yields sat() codes, or None for lines that are not formulas, in input order. With
+# cache_path, results are looked up in and added to that on-disk SatCache.
+def imap_sat(fmlas, processes=None, chunksize=64, cache_path=None, cache_size=65536):
+    return imap_ordered(check, fmlas, processes, chunksize, open_cache, (cache_size, cache_path))
+
+
+def sat_batch(fmlas, processes=None, chunksize=64, cache_path=None, cache_size=65536):
+    return list(imap_sat(fmlas, processes, chunksize, cache_path, cache_size))
+
+
+# Masks of the valuations satisfying each propositional formula (see truthtable.py),
+# or None for lines that are not propositional formulas; a formula is satisfiable
+# when its mask is non-zero. A mask is a handful of integer operations, so this runs
+# in this process rather than paying for a worker pool.
+def proposition_masks(fmlas):
+    masks = []
+    for fmla in fmlas:
+        tree = proposition_tree(fmla)
+        masks.append(None if tree is None else tree_mask(tree))
+    return masks
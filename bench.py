@@ -0,0 +1,276 @@
+import argparse
+import glob
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+from cli import MODES, report
+from snapshot import open_compiled
+from tableau import formula_table, parse_tree, preprocess
+
+# Generated workloads: each family maps a size to a formula, and is run at sizes
+# 1, 2, 4, ... up to --max-size so the results show how the cost grows. The parts of
+# a formula are different atoms and every quantifier binds a variable in its scope,
+# so a larger size is a larger search and not just more text to parse.
+WORKLOADS = {
+    'negations': lambda n: nested_negations(atoms(n + 1)),
+    'conjunctions': lambda n: chain('/\\', atoms(n)),
+    'disjunctions': lambda n: '(%s/\\%s)' % (chain('\\/', ['E%s%s' % (atom[2], atom) for atom in atoms(n)]),
+                                             chain('/\\', ['A%s~%s' % (atom[2], atom) for atom in atoms(n)])),
+    'first-order-conjunctions': lambda n: chain('/\\', ['ExP(x,x)'] + [
+        'Ax(%s\\/~%s)' % (X_ATOMS[i % len(X_ATOMS)], X_ATOMS[(i + 1 + i // len(X_ATOMS)) % len(X_ATOMS)])
+        for i in range(n)]),
+    'alternations': lambda n: alternations(n),
+}
+# every predicate over every pair of variables
+ATOMS = ['%s(%s,%s)' % (predicate, a, b) for predicate in 'PQRS' for a in 'xyzw' for b in 'xyzw']
+X_ATOMS = [atom for atom in ATOMS if 'x' in atom]
+
+
+def atoms(n):
+    return [ATOMS[i % len(ATOMS)] for i in range(n)]
+
+
+def chain(connective, parts):
+    fmla = parts[0]
+    for part in parts[1:]:
+        fmla = '(%s%s%s)' % (fmla, connective, part)
+    return fmla
+
+
+# ~(A\/~(B\/~(C\/D))), ~ nested as deep as there are parts
+def nested_negations(parts):
+    fmla = parts[-1]
+    for part in reversed(parts[:-1]):
+        fmla = '~(%s\\/%s)' % (part, fmla)
+    return fmla
+
+
+# AxAyEz alternations, each quantifier over a binary formula that uses its variable
+# next to the nested alternations, e.g. Ax(P(x,z)/\Ay(Q(y,x)/\Ez(R(z,y)\/S(x,x))))
+def alternations(n):
+    fmla = 'S(x,x)'
+    for i in reversed(range(n)):
+        var, outer, quantifier = 'xyz'[i % 3], 'xyz'[(i - 1) % 3], 'AAE'[i % 3]
+        fmla = '%s%s(%s(%s,%s)%s%s)' % (quantifier, var, 'PQR'[i % 3], var, outer,
+                                       '\\/' if quantifier == 'E' else '/\\', fmla)
+    return fmla
+
+
+def find_corpora(root):
+    paths = glob.glob(os.path.join(root, 'input.txt')) + glob.glob(os.path.join(root, '*', 'input.txt')) + \
+        glob.glob(os.path.join(root, '*', '*', 'input.txt'))
+    corpora = []
+    for path in sorted(paths):
+        directory = os.path.dirname(path)
+        if os.path.exists(os.path.join(directory, 'output.txt')):
+            corpora.append(os.path.relpath(directory, root))
+    return corpora
+
+
+def read_corpus(directory):
+    with open(os.path.join(directory, 'input.txt')) as f:
+        lines = f.read().split('\n')
+    with open(os.path.join(directory, 'output.txt')) as f:
+        expected = f.read().split('\n')
+    # same header handling and line splitting as the driver in tableau.py
+    modes = [mode for mode in MODES if mode in lines[0]]
+    fmlas = lines[1:]
+    if fmlas and fmlas[-1] == '':
+        fmlas.pop()
+    return fmlas, modes, [line for line in expected if line]
+
+
+# Parsed and preprocessed trees are cached for the whole process and interned
+# formulas kept in formula_table, so every timed run and the memory pass start with
+# all three empty; otherwise repeats would only time cache hits.
+def clear_caches():
+    parse_tree.cache_clear()
+    preprocess.cache_clear()
+    formula_table.clear()
+
+
+# With a snapshot of the formulas, lines are checked from it instead of being parsed.
+def time_formulas(fmlas, modes, repeat, snapshot=None):
+    outputs = []
+    seconds = []
+    for i, fmla in enumerate(fmlas):
+        best = None
+        for _ in range(repeat):
+            clear_caches()
+            start = time.perf_counter()
+            output = report(fmla, modes) if snapshot is None else snapshot.report(i, modes)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        outputs.append(output)
+        seconds.append(best)
+    return outputs, seconds
+
+
+def peak_memory(fmlas, modes, snapshot=None):
+    clear_caches()
+    tracemalloc.start()
+    try:
+        for i, fmla in enumerate(fmlas):
+            if snapshot is None:
+                report(fmla, modes)
+            else:
+                snapshot.report(i, modes)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def summary(seconds):
+    total = sum(seconds)
+    return {
+        'formulas': len(seconds),
+        'seconds': total,
+        'throughput': len(seconds) / total if total else None,
+        'mean_ms': 1000 * total / len(seconds),
+        'p50_ms': 1000 * percentile(seconds, 0.5),
+        'p95_ms': 1000 * percentile(seconds, 0.95),
+        'max_ms': 1000 * max(seconds),
+    }
+
+
+def snapshot_path(snapshots, name):
+    return os.path.join(snapshots, (name.strip('.').strip(os.sep).replace(os.sep, '_') or 'input') + '.snap')
+
+
+def run_corpus(root, name, repeat, memory, snapshots=None):
+    fmlas, modes, expected = read_corpus(os.path.join(root, name))
+    snapshot = None
+    if snapshots is not None:
+        snapshot = open_compiled(os.path.join(root, name, 'input.txt'), snapshot_path(snapshots, name))
+    outputs, seconds = time_formulas(fmlas, modes, repeat, snapshot)
+    lines = [line for output in outputs for line in output.split('\n') if line]
+    mismatches = []
+    for i in range(max(len(lines), len(expected))):
+        got = lines[i] if i < len(lines) else None
+        want = expected[i] if i < len(expected) else None
+        if got != want:
+            mismatches.append({'line': i + 1, 'expected': want, 'output': got})
+    result = {'name': name, 'modes': modes, 'snapshot': snapshot is not None, 'mismatches': mismatches}
+    result.update(summary(seconds) if seconds else {'formulas': 0})
+    if memory and fmlas:
+        result['peak_bytes'] = peak_memory(fmlas, modes, snapshot)
+    result['results'] = [{'formula': fmla, 'ms': 1000 * s, 'output': output}
+                         for fmla, s, output in zip(fmlas, seconds, outputs)]
+    return result
+
+
+def run_workload(name, max_size, repeat, memory):
+    results = []
+    size = 1
+    while size <= max_size:
+        fmla = WORKLOADS[name](size)
+        outputs, seconds = time_formulas([fmla], ['SAT'], repeat)
+        result = {'size': size, 'length': len(fmla), 'ms': 1000 * seconds[0], 'output': outputs[0]}
+        if memory:
+            result['peak_bytes'] = peak_memory([fmla], ['SAT'])
+        results.append(result)
+        size *= 2
+    return {'name': name, 'results': results}
+
+
+def run(root='.', workloads=None, max_size=64, repeat=1, memory=True, snapshots=None):
+    if snapshots is not None:
+        os.makedirs(snapshots, exist_ok=True)
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'repeat': repeat,
+        'corpora': [run_corpus(root, name, repeat, memory, snapshots) for name in find_corpora(root)],
+        'workloads': [run_workload(name, max_size, repeat, memory) for name in (workloads or WORKLOADS)],
+    }
+
+
+# Differences from a baseline run worth failing on: outputs that changed, and timings
+# more than tolerance (a fraction) slower. Timings under min_ms are too noisy to compare.
+def regressions(baseline, current, tolerance=0.25, min_ms=1.0):
+    found = []
+
+    def slower(what, before, after):
+        if after > max(before, min_ms) * (1 + tolerance):
+            found.append('%s: %.3f ms -> %.3f ms' % (what, before, after))
+
+    corpora = {corpus['name']: corpus for corpus in baseline['corpora']}
+    for corpus in current['corpora']:
+        before = corpora.get(corpus['name'])
+        if before is None or not corpus['formulas']:
+            continue
+        new = {mismatch['line'] for mismatch in corpus['mismatches']} - \
+            {mismatch['line'] for mismatch in before['mismatches']}
+        for line in sorted(new):
+            found.append('%s: line %d no longer matches output.txt' % (corpus['name'], line))
+        slower('%s mean' % corpus['name'], before['mean_ms'], corpus['mean_ms'])
+        slower('%s p95' % corpus['name'], before['p95_ms'], corpus['p95_ms'])
+
+    workloads = {workload['name']: workload for workload in baseline['workloads']}
+    for workload in current['workloads']:
+        sizes = {result['size']: result for result in workloads.get(workload['name'], {'results': []})['results']}
+        for result in workload['results']:
+            before = sizes.get(result['size'])
+            if before is None:
+                continue
+            what = '%s size %d' % (workload['name'], result['size'])
+            if result['output'] != before['output']:
+                found.append('%s: output changed from %r to %r' % (what, before['output'], result['output']))
+            slower(what, before['ms'], result['ms'])
+    return found
+
+
+def print_report(results, out):
+    for corpus in results['corpora']:
+        if not corpus['formulas']:
+            continue
+        out.write('%-24s %4d formulas %9.3f ms mean %9.3f ms p95 %9.1f/s %4d mismatches\n' % (
+            corpus['name'], corpus['formulas'], corpus['mean_ms'], corpus['p95_ms'], corpus['throughput'] or 0,
+            len(corpus['mismatches'])))
+    for workload in results['workloads']:
+        out.write('%-24s %s\n' % (workload['name'], ' '.join(
+            '%d:%.3fms' % (result['size'], result['ms']) for result in workload['results'])))
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Time parse() and sat() over the bundled corpora and generated workloads.')
+    parser.add_argument('--root', default='.', help='directory searched for input.txt/output.txt pairs')
+    parser.add_argument('-o', '--output', help='write the results as JSON to this file')
+    parser.add_argument('--compare', metavar='BASELINE', help='JSON results of an earlier run to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='slowdown allowed before it counts as a regression')
+    parser.add_argument('--workload', action='append', choices=sorted(WORKLOADS), help='workload to run (default all)')
+    parser.add_argument('--max-size', type=int, default=64, help='largest generated workload size')
+    parser.add_argument('--repeat', type=int, default=1, help='runs per formula, keeping the fastest')
+    parser.add_argument('--snapshots', metavar='DIR',
+                        help='check the corpora from snapshots kept in DIR, compiled again when an input.txt changes')
+    parser.add_argument('--no-memory', action='store_true', help='skip the slower tracemalloc pass for peak memory')
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    results = run(args.root, args.workload, args.max_size, args.repeat, not args.no_memory, args.snapshots)
+    print_report(results, sys.stdout)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=1)
+    if args.compare:
+        with open(args.compare) as f:
+            found = regressions(json.load(f), results, args.tolerance)
+        for regression in found:
+            print('REGRESSION %s' % regression)
+        return 1 if found else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,99 @@
+import sqlite3
+from collections import OrderedDict
+
+import tableau
+from tableau import canonical, theory
+
+
+# Everything besides the formula that a sat() result depends on: the search limits
+# and the first order engine. A search cut short by a smaller budget may give 2
+# where a larger one decides the formula.
+def search_settings():
+    return '%s %s %s %s %s' % (tableau.FIRST_ORDER_ENGINE, tableau.MAX_CONSTANTS, tableau.MAX_NODES,
+                               tableau.MAX_SECONDS, tableau.MAX_BRANCHES)
+
+
+class SatCache:
+
+    # Results of sat() keyed on the canonical text of the formula, so alpha-variants
+    # and double negations share an entry, and on search_settings(). Recently used
+    # results are kept in memory; with a path every result is also written to an
+    # sqlite database that later runs, and other processes, read from. The "may or may
+    # not be satisfiable" code is cached like any other so the expensive runs that end
+    # in it are never repeated, but only for searches with the same limits.
+    def __init__(self, maxsize=65536, path=None):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.db = None
+        if path is not None:
+            self.db = sqlite3.connect(path, timeout=60, isolation_level=None)
+            self.db.execute('PRAGMA journal_mode=WAL')
+            self.db.execute('PRAGMA synchronous=NORMAL')
+            self.db.execute('CREATE TABLE IF NOT EXISTS sat_results (formula TEXT NOT NULL, settings TEXT NOT NULL, '
+                            'result INTEGER NOT NULL, PRIMARY KEY (formula, settings))')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+    def remember(self, key, result):
+        self.entries[key] = result
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def lookup(self, key):
+        result = self.entries.get(key)
+        if result is not None:
+            self.entries.move_to_end(key)
+            return result
+        if self.db is not None:
+            row = self.db.execute('SELECT result FROM sat_results WHERE formula = ? AND settings = ?', key).fetchone()
+            if row is not None:
+                self.remember(key, row[0])
+                return row[0]
+        return None
+
+    def store(self, key, result):
+        self.remember(key, result)
+        if self.db is not None:
+            self.db.execute('INSERT OR REPLACE INTO sat_results VALUES (?, ?, ?)', key + (result,))
+
+    def sat(self, fmla):
+        key = (canonical(fmla), search_settings())
+        result = self.lookup(key)
+        if result is None:
+            self.misses += 1
+            result = tableau.sat([theory(fmla)])
+            self.store(key, result)
+        else:
+            self.hits += 1
+        return result
+
+
+# Process-wide cache used by cached_sat(), set up with open_cache(). Batch and CLI
+# workers call open_cache() when they start, so each has its own in-memory layer
+# while all of them share the database file.
+results_cache = None
+
+
+def open_cache(maxsize=65536, path=None):
+    global results_cache
+    if results_cache is not None:
+        results_cache.close()
+    results_cache = SatCache(maxsize, path)
+    return results_cache
+
+
+def cached_sat(fmla):
+    if results_cache is None:
+        return tableau.sat([theory(fmla)])
+    return results_cache.sat(fmla)
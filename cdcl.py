@@ -0,0 +1,266 @@
+import heapq
+import sys
+
+# sat() decides propositional formulas from truth tables (truthtable.py). This
+# solver is kept only to cross-check them, see main().
+
+# Literals are ints: 2 * var for the variable, 2 * var + 1 for its negation, so
+# lit ^ 1 is the complementary literal. Variables are numbered from 1.
+
+
+class CNF:
+
+    def __init__(self):
+        self.num_vars = 0
+        self.clauses = []
+        self.atoms = {}
+
+    def new_var(self):
+        self.num_vars += 1
+        return self.num_vars
+
+    def atom(self, symbol):
+        if symbol not in self.atoms:
+            self.atoms[symbol] = self.new_var()
+        return 2 * self.atoms[symbol]
+
+    # Tseitin encoding of a propositional Formula tree: each binary connective gets a
+    # fresh variable g with clauses for g <-> (a conn b), and negation just flips the
+    # literal, so the result is linear in the size of the formula.
+    def encode(self, tree):
+        negated = 0
+        while tree.kind == 'neg':
+            negated ^= 1
+            tree = tree.left
+        if tree.kind == 'atom':
+            return self.atom(tree.symbol) ^ negated
+        a = self.encode(tree.left)
+        b = self.encode(tree.right)
+        g = 2 * self.new_var()
+        if tree.symbol == '/\\':
+            self.clauses += [[g ^ 1, a], [g ^ 1, b], [g, a ^ 1, b ^ 1]]
+        elif tree.symbol == '\\/':
+            self.clauses += [[g ^ 1, a, b], [g, a ^ 1], [g, b ^ 1]]
+        else:
+            self.clauses += [[g ^ 1, a ^ 1, b], [g, a], [g, b ^ 1]]
+        return g ^ negated
+
+    def assert_formula(self, tree):
+        self.clauses.append([self.encode(tree)])
+
+
+class Solver:
+
+    def __init__(self, num_vars, clauses):
+        self.num_vars = num_vars
+        self.values = [-1] * (num_vars + 1)
+        self.levels = [0] * (num_vars + 1)
+        self.reasons = [None] * (num_vars + 1)
+        self.phases = [1] * (num_vars + 1)
+        self.activity = [0.0] * (num_vars + 1)
+        self.increment = 1.0
+        self.order = [(0.0, var) for var in range(1, num_vars + 1)]
+        self.watches = [[] for _ in range(2 * num_vars + 2)]
+        self.clauses = []
+        self.trail = []
+        self.trail_limits = []
+        self.head = 0
+        self.conflicts = 0
+        self.ok = True
+        for clause in clauses:
+            self.add_clause(clause)
+
+    def value(self, lit):
+        value = self.values[lit >> 1]
+        return value if value < 0 else value ^ (lit & 1)
+
+    def add_clause(self, clause):
+        clause = list(dict.fromkeys(clause))
+        if any(lit ^ 1 in clause for lit in clause):
+            return
+        if not clause:
+            self.ok = False
+        elif len(clause) == 1:
+            value = self.value(clause[0])
+            if value == 0:
+                self.ok = False
+            elif value < 0:
+                self.assign(clause[0], None)
+        else:
+            self.watch(clause)
+
+    def watch(self, clause):
+        index = len(self.clauses)
+        self.clauses.append(clause)
+        self.watches[clause[0]].append(index)
+        self.watches[clause[1]].append(index)
+        return index
+
+    def assign(self, lit, reason):
+        var = lit >> 1
+        self.values[var] = 1 ^ (lit & 1)
+        self.levels[var] = len(self.trail_limits)
+        self.reasons[var] = reason
+        self.trail.append(lit)
+
+    # Two watched literals: a clause is only visited when one of its two watched
+    # literals becomes false. The literal a clause implies is kept in position 0.
+    def propagate(self):
+        while self.head < len(self.trail):
+            false_lit = self.trail[self.head] ^ 1
+            self.head += 1
+            watching = self.watches[false_lit]
+            kept = []
+            for position, index in enumerate(watching):
+                clause = self.clauses[index]
+                if clause[0] == false_lit:
+                    clause[0], clause[1] = clause[1], clause[0]
+                if self.value(clause[0]) == 1:
+                    kept.append(index)
+                    continue
+                for k in range(2, len(clause)):
+                    if self.value(clause[k]) != 0:
+                        clause[1], clause[k] = clause[k], clause[1]
+                        self.watches[clause[1]].append(index)
+                        break
+                else:
+                    kept.append(index)
+                    if self.value(clause[0]) == 0:
+                        kept.extend(watching[position + 1:])
+                        self.watches[false_lit] = kept
+                        return clause
+                    self.assign(clause[0], index)
+            self.watches[false_lit] = kept
+        return None
+
+    def bump(self, var):
+        self.activity[var] += self.increment
+        if self.activity[var] > 1e100:
+            self.activity = [activity * 1e-100 for activity in self.activity]
+            self.increment *= 1e-100
+            self.order = [(-self.activity[v], v) for v in range(1, self.num_vars + 1) if self.values[v] < 0]
+            heapq.heapify(self.order)
+        elif self.values[var] < 0:
+            heapq.heappush(self.order, (-self.activity[var], var))
+
+    # First unique implication point learning: resolve the conflict clause with the
+    # reasons of current-level literals until only one of them is left.
+    def analyze(self, conflict):
+        level = len(self.trail_limits)
+        seen = set()
+        learnt = [None]
+        pending = 0
+        index = len(self.trail) - 1
+        lit = None
+        clause = conflict
+        while True:
+            for other in (clause if lit is None else clause[1:]):
+                var = other >> 1
+                if var not in seen and self.levels[var] > 0:
+                    seen.add(var)
+                    self.bump(var)
+                    if self.levels[var] == level:
+                        pending += 1
+                    else:
+                        learnt.append(other)
+            while self.trail[index] >> 1 not in seen:
+                index -= 1
+            lit = self.trail[index]
+            index -= 1
+            pending -= 1
+            if pending == 0:
+                break
+            clause = self.clauses[self.reasons[lit >> 1]]
+        learnt[0] = lit ^ 1
+        back_level = 0
+        if len(learnt) > 1:
+            deepest = max(range(1, len(learnt)), key=lambda i: self.levels[learnt[i] >> 1])
+            learnt[1], learnt[deepest] = learnt[deepest], learnt[1]
+            back_level = self.levels[learnt[1] >> 1]
+        self.increment /= 0.95
+        return learnt, back_level
+
+    def backtrack(self, level):
+        if len(self.trail_limits) > level:
+            start = self.trail_limits[level]
+            for lit in self.trail[start:]:
+                var = lit >> 1
+                self.phases[var] = self.values[var]
+                self.values[var] = -1
+                self.reasons[var] = None
+                heapq.heappush(self.order, (-self.activity[var], var))
+            del self.trail[start:]
+            del self.trail_limits[level:]
+            self.head = start
+
+    def decide(self):
+        while self.order:
+            var = heapq.heappop(self.order)[1]
+            if self.values[var] < 0:
+                self.trail_limits.append(len(self.trail))
+                self.assign(2 * var + (self.phases[var] ^ 1), None)
+                return True
+        return False
+
+    def solve(self):
+        if not self.ok:
+            return False
+        restart = 100
+        while True:
+            conflict = self.propagate()
+            if conflict is not None:
+                self.conflicts += 1
+                if not self.trail_limits:
+                    self.ok = False
+                    return False
+                learnt, back_level = self.analyze(conflict)
+                self.backtrack(back_level)
+                if len(learnt) == 1:
+                    self.assign(learnt[0], None)
+                else:
+                    self.assign(learnt[0], self.watch(learnt))
+            elif self.conflicts >= restart:
+                restart += int(restart * 1.5)
+                self.backtrack(0)
+            elif not self.decide():
+                return True
+
+    def model(self):
+        return [None] + [value == 1 for value in self.values[1:]]
+
+
+# sat() code for a tableau whose formulas are all propositional Formula trees:
+# 1 if the formulas of some branch are jointly satisfiable, 0 otherwise.
+def proposition_sat(branches):
+    for trees in branches:
+        cnf = CNF()
+        for tree in trees:
+            cnf.assert_formula(tree)
+        if Solver(cnf.num_vars, cnf.clauses).solve():
+            return 1
+    return 0
+
+
+# Cross-checks the CDCL engine against the tableau on every propositional line of
+# the given input files, e.g. python cdcl.py testinputs/*/input.txt
+def main(paths):
+    import tableau
+
+    mismatches = 0
+    for path in paths:
+        with open(path) as f:
+            lines = [line[:-1] if line.endswith('\n') else line for line in f][1:]
+        for line in lines:
+            tree = tableau.proposition_tree(line)
+            if tree is None:
+                continue
+            expected = tableau.tableau_sat([tableau.theory(line)])
+            if proposition_sat([[tree]]) != expected:
+                mismatches += 1
+                print('%s: %s gives %d from the tableau but %d from CDCL' % (path, line, expected, 1 - expected))
+    print('%d mismatches' % mismatches)
+    return mismatches
+
+
+if __name__ == '__main__':
+    sys.exit(1 if main(sys.argv[1:]) else 0)
@@ -0,0 +1,211 @@
+import argparse
+import io
+import json
+import sys
+import time
+from functools import partial
+from itertools import chain
+
+import tableau
+from batch import imap_ordered
+from cache import cached_sat, open_cache
+from instrument import Instrumentation
+from tableau import Theory, con, lhs, parse, parseOutputs, rhs, satOutput
+
+MODES = ['PARSE', 'SAT']
+
+entailmentOutput = ['is not entailed', 'is entailed', 'may or may not be entailed']
+
+
+def report(line, modes):
+    parsed = parse(line)
+    output = []
+    if 'PARSE' in modes:
+        text = '%s is %s.' % (line, parseOutputs[parsed])
+        if parsed in [5, 8]:
+            text += ' Its left hand side is %s, its connective is %s, and its right hand side is %s.' % (lhs(line), con(line), rhs(line))
+        output.append(text)
+    if 'SAT' in modes:
+        if parsed:
+            output.append('%s %s.' % (line, satOutput[cached_sat(line)]))
+        else:
+            output.append('%s is not a formula.' % line)
+    return '\n'.join(output)
+
+
+def header_modes(line):
+    words = line.split()
+    if words and all(word in MODES for word in words):
+        return [mode for mode in MODES if mode in words]
+    return None
+
+
+def text_formulas(lines):
+    for line in lines:
+        if line.endswith('\n'):
+            line = line[:-1]
+        yield line
+
+
+def jsonl_formulas(lines):
+    for line in lines:
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        yield record if isinstance(record, str) else record['formula']
+
+
+# Returns the formulas to check and the modes to check them in. A plain text input
+# may start with the same PARSE/SAT header line as input.txt; modes given on the
+# command line take precedence over it, and SAT is the default when neither is given.
+def read_input(stream, fmt, modes):
+    if fmt == 'jsonl':
+        return jsonl_formulas(stream), modes or ['SAT']
+    first = stream.readline()
+    found = header_modes(first)
+    if found is None:
+        stream = chain([first] if first else [], stream)
+    return text_formulas(stream), modes or found or ['SAT']
+
+
+# A theory file lists its premises, one per line, followed by queries, each on a line
+# starting with '?'. Blank lines and lines starting with '#' are skipped. Returns the
+# premises and the queries, which are read lazily.
+def read_theory(stream):
+    lines = text_formulas(stream)
+    premises = []
+    for line in lines:
+        if line.startswith('?'):
+            return premises, theory_queries(chain([line], lines))
+        if line.strip() and not line.startswith('#'):
+            if not parse(line):
+                raise ValueError('premise %s is not a formula' % line)
+            premises.append(line)
+    return premises, iter(())
+
+
+def theory_queries(lines):
+    for line in lines:
+        if line.startswith('?'):
+            yield line[1:].strip()
+        elif line.strip() and not line.startswith('#'):
+            raise ValueError('premise %s follows a query' % line)
+
+
+# The Theory that report_query() checks queries against, set up once per process by
+# open_theory().
+current_theory = None
+
+
+# Worker initializer. Settings are passed in rather than inherited, since workers
+# started with spawn or forkserver import tableau afresh.
+def start_worker(cache_size, cache_path, engine):
+    tableau.FIRST_ORDER_ENGINE = engine
+    open_cache(cache_size, cache_path)
+
+
+def open_theory(premises):
+    global current_theory
+    current_theory = Theory(premises)
+
+
+def report_query(query):
+    if not parse(query):
+        return '%s is not a formula.' % query
+    return '%s %s.' % (query, entailmentOutput[current_theory.entails(query)])
+
+
+class ResultWriter:
+
+    def __init__(self, out, flush_lines=0, flush_seconds=0):
+        self.out = out
+        self.flush_lines = flush_lines
+        self.flush_seconds = flush_seconds
+        self.unflushed = 0
+        self.last_flush = time.monotonic()
+
+    def write(self, text):
+        self.out.write(text + '\n')
+        self.unflushed += 1
+        if self.flush_lines and self.unflushed >= self.flush_lines:
+            self.flush()
+        elif self.flush_seconds and time.monotonic() - self.last_flush >= self.flush_seconds:
+            self.flush()
+
+    def flush(self):
+        self.out.flush()
+        self.unflushed = 0
+        self.last_flush = time.monotonic()
+
+
+def open_input(path):
+    if path == '-':
+        return io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8')
+    return open(path, encoding='utf-8')
+
+
+def open_output(path, buffer_size):
+    if path == '-':
+        return io.TextIOWrapper(io.BufferedWriter(io.FileIO(sys.stdout.fileno(), 'w', closefd=False), buffer_size), encoding='utf-8')
+    return open(path, 'w', encoding='utf-8', buffering=buffer_size)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Parse formulas and check their satisfiability with the tableau method.')
+    parser.add_argument('input', nargs='?', default='-', help='input file, or - for stdin (default)')
+    parser.add_argument('-o', '--output', default='-', help='output file, or - for stdout (default)')
+    parser.add_argument('--format', choices=['text', 'jsonl', 'theory'], default='text',
+                        help='text: one formula per line, optionally after a PARSE/SAT header; '
+                             'jsonl: one JSON string or {"formula": ...} object per line; '
+                             'theory: premises, then queries on lines starting with ? checked for entailment')
+    parser.add_argument('--parse', action='store_true', help='report what kind of formula each line is')
+    parser.add_argument('--sat', action='store_true', help='report whether each formula is satisfiable')
+    parser.add_argument('-j', '--processes', type=int, default=1, help='worker processes (default 1, 0 for one per CPU)')
+    parser.add_argument('--chunksize', type=int, default=64, help='formulas sent to a worker at a time')
+    parser.add_argument('--cache', metavar='PATH', help='sqlite file to read and store satisfiability results in')
+    parser.add_argument('--cache-size', type=int, default=65536, help='results kept in memory per process')
+    parser.add_argument('--buffer-size', type=int, default=1 << 16, help='output buffer size in bytes')
+    parser.add_argument('--flush-lines', type=int, default=0, help='flush after this many results (0: when the buffer fills)')
+    parser.add_argument('--flush-seconds', type=float, default=0, help='flush when this long has passed since the last flush')
+    parser.add_argument('--engine', choices=['ground', 'free-variable'], default='ground',
+                        help='first order search used by --sat (default ground, see tableau.FIRST_ORDER_ENGINE)')
+    parser.add_argument('--stats', action='store_true', help='print search statistics as JSON to stderr when done')
+    parser.add_argument('--trace', metavar='PATH', help='write every tableau expansion to this file as JSON lines')
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    modes = [mode for mode, flag in zip(MODES, [args.parse, args.sat]) if flag]
+    processes = args.processes or None
+    stats = None
+    if args.stats or args.trace:
+        # statistics are collected in this process, so the formulas are checked here too
+        processes = 1
+        stats = Instrumentation(open(args.trace, 'w', encoding='utf-8') if args.trace else None).enable()
+    try:
+        with open_input(args.input) as stream, open_output(args.output, args.buffer_size) as out:
+            if args.format == 'theory':
+                premises, queries = read_theory(stream)
+                results = imap_ordered(report_query, queries, processes, args.chunksize, open_theory, (premises,))
+            else:
+                fmlas, modes = read_input(stream, args.format, modes)
+                results = imap_ordered(partial(report, modes=modes), fmlas, processes, args.chunksize,
+                                       start_worker, (args.cache_size, args.cache, args.engine))
+            writer = ResultWriter(out, args.flush_lines, args.flush_seconds)
+            for text in results:
+                if text:
+                    writer.write(text)
+            writer.flush()
+    finally:
+        if stats is not None:
+            stats.disable()
+            if stats.trace is not None:
+                stats.trace.close()
+            if args.stats:
+                json.dump(stats.report(), sys.stderr, indent=1)
+                sys.stderr.write('\n')
+
+
+if __name__ == '__main__':
+    main()
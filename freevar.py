@@ -0,0 +1,237 @@
+import sys
+import time
+
+# A free-variable tableau for formulas in negation normal form (see tableau.preprocess),
+# as Formula trees. A gamma formula AxA is instantiated with a fresh free variable
+# rather than with each constant in turn, an existential ExA with a Skolem term over
+# the free variables of ExA, and a branch closes when a literal unifies with the
+# complement of an earlier one. The closing substitution is shared by the whole
+# tableau, so the search backtracks over the ways each branch can close. As in the
+# ground search of sat(), free variables of the input formulas are constants that
+# quantifiers do not range over, so free variables never stand for them.
+
+
+class OutOfBudget(Exception):
+    pass
+
+
+class Satisfiable(Exception):
+    pass
+
+
+def is_variable(term):
+    return type(term) is tuple and term[0] == '?'
+
+
+def resolve(term, subst):
+    while is_variable(term) and term in subst:
+        term = subst[term]
+    return term
+
+
+def occurs(var, term, subst):
+    term = resolve(term, subst)
+    if term == var:
+        return True
+    return type(term) is tuple and term[0] == 'sk' and any(occurs(var, arg, subst) for arg in term[2])
+
+
+def unify(a, b, subst):
+    a, b = resolve(a, subst), resolve(b, subst)
+    if a == b:
+        return subst
+    if is_variable(b):
+        a, b = b, a
+    if is_variable(a):
+        if type(b) is str or occurs(a, b, subst):
+            return None
+        subst = dict(subst)
+        subst[a] = b
+        return subst
+    if type(a) is tuple and type(b) is tuple and a[:2] == b[:2]:
+        for x, y in zip(a[2], b[2]):
+            subst = unify(x, y, subst)
+            if subst is None:
+                return None
+        return subst
+    return None
+
+
+# The substitution under which literals a and b (atoms or predicates, without their
+# negations) are the same, or None.
+def unify_atoms(a, b, subst):
+    if a.kind != b.kind or a.symbol != b.symbol:
+        return None
+    if a.kind == 'atom':
+        return subst
+    subst = unify(a.left, b.left, subst)
+    return None if subst is None else unify(a.right, b.right, subst)
+
+
+def clashes(literals, subst):
+    return any(positive and not other_positive and unify_atoms(atom, other, subst) is not None
+               for positive, atom in literals for other_positive, other in literals)
+
+
+def substitute(node, var, term):
+    if node.kind == 'pred':
+        if node.left != var and node.right != var:
+            return node
+        return node._replace(left=term if node.left == var else node.left,
+                             right=term if node.right == var else node.right)
+    if node.kind == 'neg':
+        return node._replace(left=substitute(node.left, var, term))
+    if node.kind in ['all', 'ex']:
+        return node if node.symbol == var else node._replace(left=substitute(node.left, var, term))
+    if node.kind == 'bin':
+        return node._replace(left=substitute(node.left, var, term), right=substitute(node.right, var, term))
+    return node
+
+
+def term_variables(term, found):
+    if is_variable(term):
+        found[term] = True
+    elif type(term) is tuple:
+        for arg in term[2]:
+            term_variables(arg, found)
+
+
+def free_variables(node, found):
+    if node.kind == 'pred':
+        term_variables(node.left, found)
+        term_variables(node.right, found)
+    elif node.kind in ['neg', 'all', 'ex']:
+        free_variables(node.left, found)
+    elif node.kind == 'bin':
+        free_variables(node.left, found)
+        free_variables(node.right, found)
+    return found
+
+
+class FreeVariableSearch:
+
+    # limit bounds the free variables on a branch; a gamma formula is not instantiated
+    # again once its branch has that many, which makes each pass finite. sat() runs
+    # passes with limits 1, 2, ... up to the constants of the budget, its nodes bound
+    # the formulas expanded over all passes and its seconds the time.
+    def __init__(self, budget):
+        self.budget = budget
+        self.deadline = None if budget.seconds is None else time.monotonic() + budget.seconds
+        self.nodes = 0
+        self.variables = 0
+        self.skolems = {}
+        self.limit = 1
+
+    def tick(self):
+        self.nodes += 1
+        if self.budget.nodes is not None and self.nodes > self.budget.nodes:
+            raise OutOfBudget()
+        if self.deadline is not None and self.nodes % 256 == 0 and time.monotonic() > self.deadline:
+            raise OutOfBudget()
+
+    def skolem_term(self, fmla):
+        key = self.skolems.setdefault(fmla, len(self.skolems))
+        return ('sk', key, tuple(free_variables(fmla, {})))
+
+    # Yields the substitutions extending subst under which the branch made of
+    # literals, fmla and pending closes.
+    def prove(self, fmla, pending, literals, free, subst):
+        self.tick()
+        kind = fmla.kind
+        if kind == 'bin' and fmla.symbol == '/\\':
+            yield from self.prove(fmla.left, (fmla.right,) + pending, literals, free, subst)
+        elif kind == 'bin':
+            for subst in self.prove(fmla.left, pending, literals, free, subst):
+                yield from self.prove(fmla.right, pending, literals, free, subst)
+        elif kind == 'all':
+            if len(free) < self.limit:
+                self.variables += 1
+                var = ('?', self.variables)
+                body = substitute(fmla.left, fmla.symbol, var)
+                yield from self.prove(body, pending + (fmla,), literals, free + (var,), subst)
+            else:
+                yield from self.next(pending, literals, free, subst)
+        elif kind == 'ex':
+            body = substitute(fmla.left, fmla.symbol, self.skolem_term(fmla))
+            yield from self.prove(body, pending, literals, free, subst)
+        elif kind == 'false':
+            yield subst
+        elif kind in ['atom', 'pred', 'neg']:
+            positive = kind != 'neg'
+            atom = fmla if positive else fmla.left
+            for other_positive, other in literals:
+                if other_positive != positive:
+                    closing = unify_atoms(atom, other, subst)
+                    if closing is not None:
+                        yield closing
+                        if closing is subst:
+                            # closed without binding anything, so no other way of
+                            # closing it is more general and it is never open
+                            return
+            if (positive, atom) not in literals:
+                literals += ((positive, atom),)
+            yield from self.next(pending, literals, free, subst)
+        else:
+            yield from self.next(pending, literals, free, subst)
+
+    def next(self, pending, literals, free, subst):
+        if pending:
+            yield from self.prove(pending[0], pending[1:], literals, free, subst)
+        elif not free and not clashes(literals, subst):
+            # a branch that never used a gamma formula has no free variables, so no
+            # substitution can close it: it is a ground, fully expanded open branch
+            raise Satisfiable()
+
+    def sat(self, trees):
+        if not trees:
+            return 1
+        limit = 1
+        while limit <= self.budget.constants:
+            self.limit = limit
+            for _ in self.prove(trees[0], tuple(trees[1:]), (), (), {}):
+                return 0
+            limit += 1
+        return 2
+
+
+# sat() code of a tableau given as lists of preprocessed Formula trees: 0 when every
+# branch closes, 1 when a branch is found open without using any gamma formula, and
+# 2 otherwise, including when the budget runs out.
+def free_variable_sat(tableau, budget):
+    results = []
+    for trees in tableau:
+        try:
+            results.append(FreeVariableSearch(budget).sat(trees))
+        except Satisfiable:
+            return 1
+        except (OutOfBudget, RecursionError):
+            results.append(2)
+    return 2 if 2 in results else 0
+
+
+# Cross-checks the free-variable search against the ground search of sat() on every
+# first order line of the given input files, e.g.
+# python freevar.py testinputs/*/input.txt
+def main(paths):
+    import tableau
+
+    lines = []
+    for path in paths:
+        with open(path) as f:
+            lines += [(path, line[:-1] if line.endswith('\n') else line) for line in f][1:]
+    mismatches = 0
+    for path, line in lines:
+        if not tableau.parse(line) or tableau.proposition_tree(line) is not None:
+            continue
+        result = free_variable_sat([[tableau.search_tree(line)]], tableau.default_budget())
+        expected = tableau.tableau_sat([[line]])
+        if result != 2 and expected != 2 and result != expected:
+            mismatches += 1
+            print('%s: %s gives %d from the ground search but %d from free variables' % (
+                path, line, expected, result))
+    print('%d mismatches' % mismatches)
+    return mismatches
+
+
+if __name__ == '__main__':
+    sys.exit(1 if main(sys.argv[1:]) else 0)
@@ -0,0 +1,136 @@
+import json
+import time
+from collections import Counter
+
+import cache
+import tableau
+from tableau import ClosureCache, FormulaTable, formula_table, parse_tree
+
+# Functions and methods whose calls are counted and timed while instrumentation is
+# enabled. They are swapped for timing wrappers on enable() and put back on disable(),
+# so a disabled Instrumentation costs nothing on these paths.
+TIMED = [(tableau, 'contradictory'), (tableau, 'expanded'), (tableau, 'pick_non_literal'), (tableau, 'push'),
+         (ClosureCache, 'prune'), (FormulaTable, 'expand'), (FormulaTable, 'instantiate')]
+
+
+def bucket(n):
+    return 0 if n <= 0 else 1 << (n.bit_length() - 1)
+
+
+class Instrumentation:
+
+    # Collects statistics on every sat() search started while it is enabled: searches
+    # and their results, rule applications, closed and pruned branches, histograms of
+    # the depth of expanded branches and of the number of open branches (bucketed by
+    # powers of two), calls and time spent in the helpers in TIMED, and cache hit rates.
+    # With a trace file, every expansion, closure and result is also written to it as
+    # one JSON line. When no Instrumentation is enabled the solver only pays for
+    # checking tableau.instrumentation at each step.
+    def __init__(self, trace=None):
+        self.trace = trace
+        self.searches = 0
+        self.results = Counter()
+        self.rules = Counter()
+        self.closed = 0
+        self.pruned = 0
+        self.depths = Counter()
+        self.widths = Counter()
+        self.calls = Counter()
+        self.seconds = Counter()
+        self.originals = []
+        self.parse_trees = parse_tree.cache_info()
+
+    def __enter__(self):
+        return self.enable()
+
+    def __exit__(self, *exc):
+        self.disable()
+
+    def enable(self):
+        if tableau.instrumentation is not None:
+            tableau.instrumentation.disable()
+        tableau.instrumentation = self
+        # parse_tree counts hits and misses for the whole process
+        self.parse_trees = parse_tree.cache_info()
+        for owner, name in TIMED:
+            func = getattr(owner, name)
+            self.originals.append((owner, name, func))
+            setattr(owner, name, self.timed('%s.%s' % (owner.__name__, name), func))
+        self.originals.append((ClosureCache, 'close', ClosureCache.close))
+        ClosureCache.close = self.traced_close(ClosureCache.close)
+        return self
+
+    def disable(self):
+        if tableau.instrumentation is self:
+            tableau.instrumentation = None
+        for owner, name, func in reversed(self.originals):
+            setattr(owner, name, func)
+        self.originals = []
+
+    def timed(self, name, func):
+        calls, seconds, perf_counter = self.calls, self.seconds, time.perf_counter
+
+        def wrapper(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                seconds[name] += perf_counter() - start
+                calls[name] += 1
+        return wrapper
+
+    def traced_close(self, close):
+        timed = self.timed('ClosureCache.close', close)
+
+        def wrapper(closures, branch, used, known=False):
+            if self.trace is not None:
+                self.write({'event': 'close', 'search': self.searches, 'depth': branch.depth, 'pruned': known,
+                            'core': sorted(formula_table.text(fmla) for fmla in used)})
+            return timed(closures, branch, used, known)
+        return wrapper
+
+    def write(self, record):
+        self.trace.write(json.dumps(record) + '\n')
+
+    def start(self, solver):
+        self.searches += 1
+        if self.trace is not None:
+            self.write({'event': 'start', 'search': self.searches, 'branches': len(solver.frontier)})
+
+    def expand(self, solver, branch, fmla, rule):
+        self.rules[rule] += 1
+        self.depths[bucket(branch.depth)] += 1
+        self.widths[bucket(len(solver.frontier) + 1)] += 1
+        if self.trace is not None:
+            self.write({'event': 'expand', 'search': self.searches, 'step': solver.nodes, 'depth': branch.depth,
+                        'open': len(solver.frontier) + 1, 'rule': rule, 'formula': formula_table.text(fmla)})
+
+    def finish(self, solver, result):
+        self.results[result] += 1
+        self.closed += solver.closures.closed
+        self.pruned += solver.closures.pruned
+        if self.trace is not None:
+            self.write({'event': 'result', 'search': self.searches, 'result': result, 'steps': solver.nodes,
+                        'closed': solver.closures.closed, 'constants': solver.constants})
+
+    def report(self):
+        info = parse_tree.cache_info()
+        caches = {'parse_tree': hit_rate(info.hits - self.parse_trees.hits, info.misses - self.parse_trees.misses),
+                  'closures': {'pruned': self.pruned, 'closed': self.closed}}
+        if cache.results_cache is not None:
+            caches['results'] = hit_rate(cache.results_cache.hits, cache.results_cache.misses)
+        return {
+            'searches': self.searches,
+            'results': {str(result): count for result, count in sorted(self.results.items())},
+            'rules': dict(self.rules),
+            'closed': self.closed,
+            'pruned': self.pruned,
+            'depths': {str(depth): count for depth, count in sorted(self.depths.items())},
+            'open_branches': {str(width): count for width, count in sorted(self.widths.items())},
+            'helpers': {name: {'calls': self.calls[name], 'seconds': self.seconds[name]} for name in sorted(self.calls)},
+            'caches': caches,
+        }
+
+
+def hit_rate(hits, misses):
+    return {'hits': hits, 'misses': misses, 'rate': hits / (hits + misses) if hits + misses else None}
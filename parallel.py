@@ -0,0 +1,218 @@
+import argparse
+import multiprocessing
+import os
+import time
+from multiprocessing.connection import wait
+
+import tableau
+from tableau import (EMPTY_QUEUE, FORMULA_MASK, PROGRESS_STEP, RULES, Branch, Budget, TableauSolver, default_budget,
+                     formula_table, gamma_progress, parse, proposition_tree, sat, satOutput, theory)
+
+# Rule applications a worker makes between looking at its messages.
+SLICE = 64
+# Rule applications the coordinator makes itself before handing the branches out.
+SEED_STEPS = 1000
+# Seconds before a worker that had no work to give is asked again.
+STEAL_BACKOFF = 0.01
+
+
+def queue_entries(queue):
+    entries = []
+    cell = queue.top
+    while cell is not None:
+        entries.append(cell[0])
+        cell = cell[1]
+    bottom = []
+    cell = queue.bottom
+    while cell is not None:
+        bottom.append(cell[0])
+        cell = cell[1]
+    return entries + bottom[::-1]
+
+
+# Branches go between processes as Formula trees, since formula IDs only mean
+# something in the formula table of the process that made them. A branch is sent as
+# what its search still depends on: its literals, the formulas waiting in each rule
+# queue and the parked gamma formulas (with how far each gamma formula got through
+# the domain), and the size of its domain. Constants are named by constant_name() in
+# the order a branch introduces them, so a branch keeps its names in any process.
+def export_branch(branch):
+    literals = []
+    bits = branch.literals
+    while bits:
+        bit = (bits & -bits).bit_length() - 1
+        literals.append(formula_table.tree(formula_table.literal_ids[bit]))
+        bits &= bits - 1
+    queues = [[(formula_table.tree(entry & FORMULA_MASK), gamma_progress(entry))
+               for entry in queue_entries(getattr(branch, rule))] for rule in RULES]
+    parked = [(formula_table.tree(entry & FORMULA_MASK), gamma_progress(entry)) for entry in branch.parked]
+    return branch.domain, literals, queues, parked
+
+
+def import_branch(state):
+    domain, literals, queues, parked = state
+    branch = Branch()
+    branch.domain = domain
+    for tree in literals:
+        branch.add(formula_table.intern(tree))
+    for rule, entries in zip(RULES, queues):
+        queue = EMPTY_QUEUE
+        for tree, used in entries:
+            fmla = formula_table.intern(tree)
+            branch.added += (fmla,)
+            queue = queue.push_back(fmla + used * PROGRESS_STEP)
+        setattr(branch, rule, queue)
+    for tree, used in parked:
+        fmla = formula_table.intern(tree)
+        branch.added += (fmla,)
+        branch.parked += (fmla + used * PROGRESS_STEP,)
+    return branch
+
+
+# Worker process: searches the branches it starts with and is sent, in the same
+# order as sat(), and answers ('share',) with the shallowest half of its frontier,
+# which are the branches with the most work left under them.
+def explore(conn, work, budget):
+    tableau.instrumentation = None
+    solver = TableauSolver([], budget)
+    solver.frontier.extend(import_branch(state) for state in work)
+    idle = False
+    while True:
+        for _ in range(SLICE):
+            if not solver.frontier:
+                break
+            result = solver.step()
+            if result is not None:
+                conn.send(('done', result))
+                return
+        if not solver.frontier and not idle:
+            conn.send(('idle', solver.undecided))
+            idle = True
+        while conn.poll(0 if solver.frontier else None):
+            message = conn.recv()
+            if message[0] == 'stop':
+                return
+            if message[0] == 'work':
+                solver.frontier.extend(import_branch(state) for state in message[1])
+                idle = False
+            elif message[0] == 'share':
+                states = [export_branch(solver.frontier.popleft()) for _ in range(len(solver.frontier) // 2)]
+                conn.send(('work', states))
+
+
+def worker_budget(budget, processes, nodes_used, deadline):
+    nodes = None if budget.nodes is None else max(1, (budget.nodes - nodes_used) // processes)
+    seconds = None if deadline is None else max(0, deadline - time.monotonic())
+    return Budget(budget.constants, nodes, seconds, budget.branches)
+
+
+# sat() code of tableau, with the search of its branches shared between worker
+# processes. The coordinator expands the tableau until there is a branch for every
+# worker and deals them out; after that a worker that runs out of branches is given
+# half of the waiting branches of a busy one. The search stops as soon as any worker
+# finds an open branch that is fully expanded. The seconds of the budget are for
+# the whole search, while its nodes are split evenly between the workers and its
+# constants and branches apply to each worker as they do to sat().
+def parallel_sat(tableau, processes=None, budget=None):
+    if all(proposition_tree(fmla) is not None for branch in tableau for fmla in branch):
+        return sat(tableau, budget)
+    processes = processes or os.cpu_count() or 1
+    budget = default_budget() if budget is None else budget
+    solver = TableauSolver(tableau, budget)
+    while solver.result is None and len(solver.frontier) < processes and solver.nodes < SEED_STEPS:
+        solver.step()
+    if solver.result is not None or processes == 1:
+        return solver.run()
+
+    deadline = solver.deadline
+    work = [export_branch(branch) for branch in solver.frontier]
+    context = multiprocessing.get_context()
+    conns = []
+    workers = []
+    try:
+        for i in range(processes):
+            conn, child = context.Pipe()
+            worker = context.Process(target=explore, daemon=True,
+                                     args=(child, work[i::processes], worker_budget(budget, processes, solver.nodes, deadline)))
+            worker.start()
+            child.close()
+            conns.append(conn)
+            workers.append(worker)
+        return coordinate(conns, deadline, solver.undecided)
+    finally:
+        for conn in conns:
+            try:
+                conn.send(('stop',))
+            except OSError:
+                pass
+        for worker in workers:
+            worker.join(1)
+            if worker.is_alive():
+                worker.terminate()
+        for conn in conns:
+            conn.close()
+
+
+def coordinate(conns, deadline, undecided):
+    idle = set()
+    asked = {}
+    retry = {}
+    while True:
+        if deadline is not None and time.monotonic() > deadline:
+            return 2
+        if len(idle) == len(conns) and not asked:
+            return 2 if undecided else 0
+        now = time.monotonic()
+        thieves = [conn for conn in conns if conn in idle and conn not in asked.values()]
+        for conn in conns:
+            if not thieves:
+                break
+            if conn not in idle and conn not in asked and retry.get(conn, 0) <= now:
+                conn.send(('share',))
+                asked[conn] = thieves.pop()
+        timeout = STEAL_BACKOFF if thieves else None
+        if deadline is not None:
+            timeout = max(0, deadline - now) if timeout is None else min(timeout, max(0, deadline - now))
+        for conn in wait(conns, timeout):
+            message = conn.recv()
+            if message[0] == 'done':
+                return message[1]
+            if message[0] == 'idle':
+                idle.add(conn)
+                undecided = undecided or message[1]
+            elif message[0] == 'work':
+                thief = asked.pop(conn)
+                if message[1]:
+                    thief.send(('work', message[1]))
+                    idle.discard(thief)
+                else:
+                    retry[conn] = time.monotonic() + STEAL_BACKOFF
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Check formulas one at a time, each searched by several processes.')
+    parser.add_argument('formulas', nargs='+', help='formulas to check')
+    parser.add_argument('-j', '--processes', type=int, default=0, help='worker processes (default 0, one per CPU)')
+    parser.add_argument('--constants', type=int, help='constants each branch may introduce (default MAX_CONSTANTS)')
+    parser.add_argument('--nodes', type=int, help='rule applications for the whole search (default MAX_NODES)')
+    parser.add_argument('--seconds', type=float, help='wall-clock limit for each search')
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    budget = default_budget()
+    if args.constants is not None:
+        budget.constants = args.constants
+    if args.nodes is not None:
+        budget.nodes = args.nodes
+    budget.seconds = args.seconds
+    for fmla in args.formulas:
+        if not parse(fmla):
+            print('%s is not a formula.' % fmla)
+            continue
+        print('%s %s.' % (fmla, satOutput[parallel_sat([theory(fmla)], args.processes or None, budget)]))
+
+
+if __name__ == '__main__':
+    main()
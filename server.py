@@ -0,0 +1,209 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import signal
+from concurrent.futures import ProcessPoolExecutor
+
+import tableau
+from cache import cached_sat, open_cache
+from tableau import parse
+
+# Longest request line read, in bytes.
+LINE_LIMIT = 1 << 20
+
+
+def solve(fmla):
+    parsed = parse(fmla)
+    return parsed, cached_sat(fmla) if parsed else None
+
+
+def start_worker(cache_size, cache_path, seconds):
+    tableau.MAX_SECONDS = seconds
+    open_cache(cache_size, cache_path)
+
+
+# Drops the rest of a line that is over the reader's limit, up to its newline.
+async def skip_line(reader):
+    while True:
+        try:
+            await reader.readuntil(b'\n')
+            return
+        except asyncio.LimitOverrunError as e:
+            await reader.readexactly(e.consumed)
+        except asyncio.IncompleteReadError:
+            return
+
+
+async def refuse(reason):
+    return {'error': 'bad request: %s' % reason}
+
+
+def request_formula(line):
+    line = line.strip()
+    if line[:1] in ['"', '{']:
+        record = json.loads(line)
+        return record if isinstance(record, str) else record['formula']
+    return line
+
+
+class SolverService:
+
+    # Formulas are solved by a pool of worker processes that stay up between requests.
+    # Requests wait in a bounded queue that a fixed number of dispatchers feed to the
+    # pool, so once it is full readers stop taking lines off their connections and
+    # clients are slowed down by TCP itself. A formula that is already queued or being
+    # solved is not queued again; its requests all wait on the same future.
+    def __init__(self, processes=None, queue_size=1024, connection_limit=256, cache_size=65536, cache_path=None,
+                 seconds=None):
+        self.processes = processes or os.cpu_count() or 1
+        # Workers are started from a fork server rather than forked from this process,
+        # which by then has client sockets open: a forked worker would keep them open
+        # and connections the service closes would never see EOF.
+        self.pool = ProcessPoolExecutor(self.processes, multiprocessing.get_context('forkserver'),
+                                        initializer=start_worker, initargs=(cache_size, cache_path, seconds))
+        self.queue = asyncio.Queue(queue_size)
+        self.connection_limit = connection_limit
+        self.in_flight = {}
+        self.dispatchers = []
+        self.requests = 0
+        self.coalesced = 0
+
+    def start(self):
+        self.dispatchers = [asyncio.create_task(self.dispatch()) for _ in range(2 * self.processes)]
+
+    async def close(self):
+        for dispatcher in self.dispatchers:
+            dispatcher.cancel()
+        await asyncio.gather(*self.dispatchers, return_exceptions=True)
+        self.pool.shutdown(cancel_futures=True)
+
+    async def dispatch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            fmla, future = await self.queue.get()
+            try:
+                result = await loop.run_in_executor(self.pool, solve, fmla)
+                if not future.done():
+                    future.set_result(result)
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            finally:
+                del self.in_flight[fmla]
+                self.queue.task_done()
+
+    async def submit(self, fmla):
+        self.requests += 1
+        future = self.in_flight.get(fmla)
+        if future is not None:
+            self.coalesced += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            self.in_flight[fmla] = future
+            try:
+                await self.queue.put((fmla, future))
+            except asyncio.CancelledError:
+                del self.in_flight[fmla]
+                future.cancel()
+                raise
+        return await asyncio.shield(future)
+
+    async def answer(self, line):
+        try:
+            fmla = request_formula(line)
+        except (ValueError, KeyError, TypeError) as e:
+            return {'error': 'bad request: %s' % e}
+        try:
+            parsed, result = await self.submit(fmla)
+        except Exception as e:
+            return {'formula': fmla, 'error': str(e)}
+        return {'formula': fmla, 'parse': parsed, 'sat': result}
+
+    # Answers are written in the order the lines arrived. At most connection_limit
+    # lines of one connection are being answered at a time. A line longer than
+    # LINE_LIMIT is answered with an error and skipped.
+    async def handle(self, reader, writer):
+        answers = asyncio.Queue(self.connection_limit)
+
+        async def respond():
+            connected = True
+            while True:
+                answer = await answers.get()
+                if answer is None:
+                    break
+                if not connected:
+                    # keep taking answers so the reader is never blocked on a full queue
+                    answer.cancel()
+                    continue
+                try:
+                    writer.write((json.dumps(await answer) + '\n').encode())
+                    await writer.drain()
+                except ConnectionError:
+                    connected = False
+
+        responder = asyncio.create_task(respond())
+        try:
+            while True:
+                try:
+                    line = await reader.readuntil(b'\n')
+                except asyncio.IncompleteReadError as e:
+                    line = e.partial
+                    if not line:
+                        break
+                except asyncio.LimitOverrunError:
+                    await skip_line(reader)
+                    await answers.put(asyncio.create_task(refuse('line longer than %d bytes' % LINE_LIMIT)))
+                    continue
+                if line.strip():
+                    await answers.put(asyncio.create_task(self.answer(line.decode())))
+            await answers.put(None)
+            await responder
+        except ConnectionError:
+            pass
+        finally:
+            responder.cancel()
+            await asyncio.gather(responder, return_exceptions=True)
+            writer.close()
+
+
+async def serve(host, port, **options):
+    service = SolverService(**options)
+    service.start()
+    server = await asyncio.start_server(service.handle, host, port, limit=LINE_LIMIT)
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    try:
+        async with server:
+            await server.serve_forever()
+    except asyncio.CancelledError:
+        pass
+    finally:
+        await service.close()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Serve parse/sat results over a local socket, one JSON line per formula.')
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on (default 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=7878, help='port to listen on (default 7878)')
+    parser.add_argument('-j', '--processes', type=int, default=0, help='worker processes (default 0, one per CPU)')
+    parser.add_argument('--queue-size', type=int, default=1024, help='formulas waiting for a worker before readers block')
+    parser.add_argument('--connection-limit', type=int, default=256, help='lines of one connection answered at a time')
+    parser.add_argument('--cache', metavar='PATH', help='sqlite file to read and store satisfiability results in')
+    parser.add_argument('--cache-size', type=int, default=65536, help='results kept in memory per worker')
+    parser.add_argument('--seconds', type=float, help='wall-clock limit for each first order search')
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        asyncio.run(serve(args.host, args.port, processes=args.processes or None, queue_size=args.queue_size,
+                          connection_limit=args.connection_limit, cache_size=args.cache_size, cache_path=args.cache,
+                          seconds=args.seconds))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
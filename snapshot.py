@@ -0,0 +1,190 @@
+import argparse
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+from cli import MODES
+from tableau import (NODE_KINDS, Formula, FormulaTable, parse, parseOutputs, proposition_tree, satOutput, search_tree,
+                     split_binary, tableau_sat)
+from truthtable import tree_mask
+
+# A snapshot holds a list of input lines already parsed and preprocessed, so they can
+# be checked again without reading any formula text. After the header come, as
+# native 32 bit ints, the offsets of the strings in the string blob, the nodes of
+# the preprocessed formulas (kind, symbol, left, right, as in a FormulaTable, with
+# nodes shared between formulas), and one record per line (see RECORD), then the
+# string blob itself in UTF-8. Everything is read in place from a read-only mmap, so
+# processes that open the same snapshot share its pages.
+MAGIC = b'TABSNAP1'
+HEADER = struct.Struct('<8s6I')
+# line, parse() code, lhs, connective, rhs, root node (-1 for lines that are not
+# formulas) and truth table mask (-1 for formulas that are not propositional)
+RECORD = 7
+NODE = 4
+
+
+def write_snapshot(path, fmlas, modes=MODES):
+    table = FormulaTable()
+    records = array('i')
+    for fmla in fmlas:
+        parsed = parse(fmla)
+        parts = [table.symbol(part) for part in split_binary(fmla)] if parsed in [5, 8] else [-1, -1, -1]
+        root = mask = -1
+        if parsed:
+            tree = proposition_tree(fmla)
+            if tree is not None:
+                mask = tree_mask(tree)
+            root = table.clean(table.intern(search_tree(fmla)))
+        records.extend([table.symbol(fmla), parsed] + parts + [root, mask])
+    nodes = array('i')
+    for fid in range(len(table)):
+        nodes.extend([table.kinds[fid], table.syms[fid], table.lefts[fid], table.rights[fid]])
+    blob = bytearray()
+    offsets = array('i', [0])
+    for symbol in table.symbols:
+        blob += symbol.encode('utf-8')
+        offsets.append(len(blob))
+    flags = sum(1 << i for i, mode in enumerate(MODES) if mode in modes) | (sys.byteorder == 'big') << 8
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, flags, len(table.symbols), len(table), len(fmlas), len(blob), 0))
+        offsets.tofile(f)
+        nodes.tofile(f)
+        records.tofile(f)
+        f.write(blob)
+
+
+class Snapshot:
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, flags, symbols, nodes, formulas, size, _ = HEADER.unpack_from(self.map)
+        if magic != MAGIC:
+            raise ValueError('%s is not a formula snapshot' % path)
+        if (flags >> 8 & 1) != (sys.byteorder == 'big'):
+            raise ValueError('%s was written on a machine of the other byte order' % path)
+        self.modes = [mode for i, mode in enumerate(MODES) if flags >> i & 1]
+        view = memoryview(self.map)
+        start = HEADER.size
+        ints = array('i').itemsize
+        self.offsets = view[start:start + ints * (symbols + 1)].cast('i')
+        start += ints * (symbols + 1)
+        self.nodes = view[start:start + ints * NODE * nodes].cast('i')
+        start += ints * NODE * nodes
+        self.records = view[start:start + ints * RECORD * formulas].cast('i')
+        start += ints * RECORD * formulas
+        self.blob = view[start:start + size]
+        self.strings = [None] * symbols
+
+    # reopened from the file rather than copied when sent to another process
+    def __reduce__(self):
+        return Snapshot, (self.path,)
+
+    def __len__(self):
+        return len(self.records) // RECORD
+
+    def close(self):
+        for view in [self.offsets, self.nodes, self.records, self.blob]:
+            view.release()
+        self.map.close()
+
+    def string(self, sid):
+        text = self.strings[sid]
+        if text is None:
+            text = self.strings[sid] = str(self.blob[self.offsets[sid]:self.offsets[sid + 1]], 'utf-8')
+        return text
+
+    def record(self, i):
+        return self.records[RECORD * i:RECORD * (i + 1)]
+
+    def line(self, i):
+        return self.string(self.records[RECORD * i])
+
+    def parse(self, i):
+        return self.records[RECORD * i + 1]
+
+    def tree(self, node):
+        kind, sym, left, right = self.nodes[NODE * node:NODE * (node + 1)]
+        kind = NODE_KINDS[kind]
+        if kind in ['neg', 'all', 'ex']:
+            return Formula(kind, self.string(sym), self.tree(left), None)
+        if kind == 'bin':
+            return Formula(kind, self.string(sym), self.tree(left), self.tree(right))
+        if kind == 'pred':
+            return Formula(kind, self.string(sym), self.string(left), self.string(right))
+        return Formula(kind, self.string(sym), None, None)
+
+    # sat() code of line i, or None if it is not a formula
+    def sat(self, i, budget=None):
+        root, mask = self.records[RECORD * i + 5:RECORD * (i + 1)]
+        if root < 0:
+            return None
+        if mask >= 0:
+            return 1 if mask else 0
+        return tableau_sat([[self.tree(root)]], budget)
+
+    # the same output as cli.report() for line i
+    def report(self, i, modes=None):
+        line, parsed, lhs, con, rhs, root, mask = self.record(i)
+        line = self.string(line)
+        output = []
+        modes = self.modes if modes is None else modes
+        if 'PARSE' in modes:
+            text = '%s is %s.' % (line, parseOutputs[parsed])
+            if lhs >= 0:
+                text += ' Its left hand side is %s, its connective is %s, and its right hand side is %s.' % (
+                    self.string(lhs), self.string(con), self.string(rhs))
+            output.append(text)
+        if 'SAT' in modes:
+            if parsed:
+                output.append('%s %s.' % (line, satOutput[self.sat(i)]))
+            else:
+                output.append('%s is not a formula.' % line)
+        return '\n'.join(output)
+
+
+# Lines and modes of an input.txt, read the same way as by the driver in tableau.py.
+def read_input(path):
+    with open(path) as f:
+        lines = f.read().split('\n')
+    fmlas = lines[1:]
+    if fmlas and fmlas[-1] == '':
+        fmlas.pop()
+    return fmlas, [mode for mode in MODES if mode in lines[0]]
+
+
+def compile_input(input_path, path):
+    fmlas, modes = read_input(input_path)
+    write_snapshot(path, fmlas, modes)
+
+
+# Snapshot of input_path kept at path, written again when input_path is newer.
+def open_compiled(input_path, path):
+    if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(input_path):
+        compile_input(input_path, path)
+    return Snapshot(path)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Compile an input.txt into a snapshot, or check the lines of one.')
+    parser.add_argument('path', help='input.txt to compile, or with --run a snapshot to check')
+    parser.add_argument('-o', '--output', help='snapshot to write (default: the input path with .snap)')
+    parser.add_argument('--run', action='store_true', help='print the output for every line of the snapshot')
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if not args.run:
+        compile_input(args.path, args.output or os.path.splitext(args.path)[0] + '.snap')
+        return
+    snapshot = Snapshot(args.path)
+    for i in range(len(snapshot)):
+        print(snapshot.report(i))
+
+
+if __name__ == '__main__':
+    main()
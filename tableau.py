@@ -1,171 +1,273 @@
 
+import asyncio
+import time
+from collections import deque, namedtuple
+from array import array
+from functools import lru_cache
+
+from freevar import free_variable_sat
+from truthtable import branch_mask, mask_valuation, tree_atoms, truth_table_sat
+
 MAX_CONSTANTS = 10
+MAX_NODES = 100000
+MAX_SECONDS = None
+MAX_BRANCHES = None
+MAX_TABLE_SIZE = 100000
+# 'ground' instantiates gamma formulas with constants; 'free-variable' first tries
+# the free-variable tableau of freevar.py and only searches for a model with the
+# ground tableau when that cannot settle the formula.
+FIRST_ORDER_ENGINE = 'ground'
+
+PROPOSITIONS = ['p', 'q', 'r', 's']
+PREDICATES = ['P', 'Q', 'R', 'S']
+VARIABLES = ['x', 'y', 'z', 'w']
+CONNECTIVES = ['=>', '/\\', '\\/']
+
+# kind is one of 'atom', 'pred', 'neg', 'all', 'ex', 'bin' or 'junk'. A predicate keeps its
+# terms in left/right, a quantifier keeps its variable in symbol, and 'junk' holds the raw
+# text of whatever follows a '~' that is neither a first order nor a propositional formula.
+Formula = namedtuple('Formula', ['kind', 'symbol', 'left', 'right'])
+
+
+def tokenize(fmla):
+    tokens = []
+    positions = []
+    i = 0
+    while i < len(fmla):
+        for conn in CONNECTIVES:
+            if fmla.startswith(conn, i):
+                tokens.append(conn)
+                break
+        else:
+            tokens.append(fmla[i])
+        positions.append(i)
+        i += len(tokens[-1])
+    positions.append(len(fmla))
+    return tokens, positions
+
+
+class FormulaParser:
+
+    def __init__(self, fmla, terms):
+        self.fmla = fmla
+        self.terms = terms
+        self.tokens, self.positions = tokenize(fmla)
+        self.matches = {}
+        self.splits = {}
+        self.balanced = self.match_brackets()
+        self.memo = {}
+
+    def match_brackets(self):
+        stack = []
+        for i, token in enumerate(self.tokens):
+            if token == '(':
+                stack.append(i)
+                self.splits[i] = []
+            elif token == ')':
+                if not stack:
+                    return False
+                self.matches[stack.pop()] = i
+            elif token in CONNECTIVES and stack:
+                self.splits[stack[-1]].append(i)
+        return not stack
+
+    def parse(self, logic):
+        if ' ' in self.fmla or not self.balanced:
+            return None
+        return self.formula(logic, 0, len(self.tokens))
+
+    # One call per level of brackets: negations and quantifiers are peeled off in a
+    # loop so long chains such as ~~~~~~~AxP(x,x) do not recurse once per symbol, and
+    # the atom, predicate or binary formula under them is matched in the same call.
+    def formula(self, logic, i, j):
+        key = (logic, i, j)
+        if key in self.memo:
+            return self.memo[key]
+        tokens = self.tokens
+        prefixes = []
+        k = i
+        while k < j:
+            if tokens[k] == '~':
+                prefixes.append(k)
+                k += 1
+            elif tokens[k] in ['A', 'E'] and k + 2 < j and tokens[k+1] in self.terms:
+                if logic == 'prop':
+                    self.memo[key] = None
+                    return None
+                prefixes.append(k)
+                k += 2
+            else:
+                break
+
+        node = None
+        if j - k == 1 and logic == 'prop' and tokens[k] in PROPOSITIONS:
+            node = Formula('atom', tokens[k], None, None)
+        elif j - k == 6 and logic == 'fol' and tokens[k] in PREDICATES and tokens[k+1] == '(' and tokens[k+3] == ',' and tokens[k+5] == ')':
+            if tokens[k+2] in self.terms and tokens[k+4] in self.terms:
+                node = Formula('pred', tokens[k], tokens[k+2], tokens[k+4])
+        elif j - k > 2 and tokens[k] == '(' and self.matches.get(k) == j - 1:
+            for split in self.splits[k]:
+                left = self.formula(logic, k + 1, split)
+                if left is None:
+                    continue
+                right = self.formula(logic, split + 1, j - 1)
+                if right is not None:
+                    node = Formula('bin', tokens[split], left, right)
+                    break
+
+        for start in reversed(prefixes):
+            if tokens[start] == '~':
+                if logic == 'prop':
+                    if node is None:
+                        break
+                elif node is None:
+                    # nothing under ~ is a first order formula, so it is tried as a
+                    # proposition, and failing that kept as junk
+                    node = self.formula('prop', start + 1, j) if start + 1 == k else None
+                    if node is None:
+                        node = Formula('junk', self.fmla[self.positions[start+1]:self.positions[j]], None, None)
+                node = Formula('neg', '~', node, None)
+            elif node is not None:
+                kind = 'all' if tokens[start] == 'A' else 'ex'
+                node = Formula(kind, tokens[start+1], node, None)
+        self.memo[key] = node
+        return node
+
+
+@lru_cache(maxsize=4096)
+def parse_tree(fmla, logic, terms):
+    return FormulaParser(fmla, terms).parse(logic)
+
+
+def proposition_tree(fmla):
+    return parse_tree(fmla.strip(), 'prop', ())
+
+
+def first_order_tree(fmla):
+    return parse_tree(fmla.strip(), 'fol', tuple(VARIABLES))
+
+
+def fmla_text(node):
+    negations = ''
+    while node.kind == 'neg':
+        negations += '~'
+        node = node.left
+    if node.kind in ['atom', 'junk', 'true', 'false']:
+        text = node.symbol
+    elif node.kind == 'pred':
+        text = '%s(%s,%s)' % (node.symbol, node.left, node.right)
+    elif node.kind == 'all':
+        text = 'A' + node.symbol + fmla_text(node.left)
+    elif node.kind == 'ex':
+        text = 'E' + node.symbol + fmla_text(node.left)
+    else:
+        text = '(' + fmla_text(node.left) + node.symbol + fmla_text(node.right) + ')'
+    return negations + text
+
+
+def binary_parts(node):
+    if node is not None and node.kind == 'bin':
+        return fmla_text(node.left), node.symbol, fmla_text(node.right)
+    return None
+
+
+def is_alpha_node(node):
+    if node.kind == 'bin':
+        return node.symbol == '/\\'
+    return node.kind == 'neg' and node.left.kind == 'bin' and node.left.symbol in ['=>', '\\/']
+
+
+def is_beta_node(node):
+    if node.kind == 'bin':
+        return node.symbol in ['\\/', '=>']
+    return node.kind == 'neg' and node.left.kind == 'bin' and node.left.symbol == '/\\'
+
+
+def is_delta_node(node):
+    return node.kind == 'ex' or (node.kind == 'neg' and node.left.kind == 'all')
+
+
+def is_gamma_node(node):
+    return node.kind == 'all' or (node.kind == 'neg' and node.left.kind == 'ex')
+
 
 class Proposition:
+    __slots__ = ['fmla', 'tree']
 
     def __init__(self, fmla):
         self.fmla = fmla.strip()
+        self.tree = proposition_tree(self.fmla)
 
     def is_proposition(self):
-        return self.fmla in ['p', 'q', 'r', 's']
+        return self.fmla in PROPOSITIONS
     
     def is_negation(self):
-        if self.fmla.startswith('~'):
-            if self.fmla[1:].startswith('(') and self.fmla[1:].endswith(')'):
-                if Proposition(self.fmla[2:-1]).is_proposition():
-                    return False
-            return True
-        return False
+        return self.tree is not None and self.tree.kind == 'neg'
     
     def is_binary_connective(self):
-        if not (self.fmla.startswith('(') and self.fmla.endswith(')')):
-            return None
-
-        brackets = 0
-        for i in range(1, len(self.fmla) - 1):
-            if self.fmla[i] == '(':
-                brackets += 1
-            elif self.fmla[i] == ')':
-                brackets -= 1
-            elif brackets == 0:
-                for conn in ['=>', '/\\', '\\/']:
-                    if self.fmla[i:i+len(conn)] == conn:
-                        left = self.fmla[1:i]
-                        right = self.fmla[i+len(conn):-1]
-                        if Proposition(left).is_fmla() and Proposition(right).is_fmla():
-                            return left, conn, right
-        return None
+        return binary_parts(self.tree)
     
     def is_fmla(self):
-        if ' ' in self.fmla or not check_matching_brackets(self.fmla):
-            return False
-
-        if self.is_proposition():
-            return True
-        elif self.is_negation() and Proposition(self.fmla[1:]).is_fmla():
-            return True
-        elif bool(self.is_binary_connective()):
-            return True
-        return False
+        return self.tree is not None
     
     def parse(self):
         if not self.is_fmla():
             return 0
-        if self.is_negation():
-            return 7
-        elif self.is_binary_connective():
-            return 8
-        elif self.is_proposition():
-            return 6
+        return {'neg': 7, 'bin': 8, 'atom': 6}[self.tree.kind]
         
     def is_alpha(self):
-        if con(self.fmla) == '/\\':
-            return True
-        elif self.is_negation() and con(self.fmla[1:]) == '=>':
-            return True
-        elif self.is_negation() and con(self.fmla[1:]) == '\\/':
-            return True
+        return self.is_fmla() and is_alpha_node(self.tree)
         
     def is_beta(self):
-        if con(self.fmla) == '\\/':
-            return True
-        elif con(self.fmla) == '=>':
-            return True
-        elif self.is_negation() and con(self.fmla[1:]) == '/\\':
-            return True
+        return self.is_fmla() and is_beta_node(self.tree)
         
 class FirstOrderLogic:
+    __slots__ = ['fmla', 'tree']
+
     def __init__(self, fmla):
         self.fmla = fmla.strip()
+        self.tree = first_order_tree(self.fmla)
 
     def is_variable(self):
-        return self.fmla in ['x', 'y', 'z', 'w']
+        return self.fmla in VARIABLES
+
+    def is_kind(self, kind):
+        return self.tree is not None and self.tree.kind == kind
 
     def is_predicate(self):
-        predicates = ['P', 'Q', 'R', 'S']
-        if len(self.fmla) > 4 and self.fmla[0] in predicates and self.fmla[1] == '(' and self.fmla[-1] == ')' and ',' in self.fmla:
-            vars = self.fmla[2:-1].split(',')
-            return len(vars) == 2 and all(var in ['x', 'y', 'z', 'w'] + constants for var in vars)
-        return False
+        return self.is_kind('pred')
 
     def is_negation(self):
-        if self.fmla.startswith('~'):
-            if FirstOrderLogic(self.fmla[1:]).is_fmla():
-                return True
-            return True
-        return False
+        return self.is_kind('neg')
 
     def is_universally_quantified(self):
-        return self.fmla.startswith('A') and self.fmla[1] in ['x', 'y', 'z', 'w'] + constants and FirstOrderLogic(self.fmla[2:]).is_fmla()
+        return self.is_kind('all')
 
     def is_existentially_quantified(self):
-        return self.fmla.startswith('E') and self.fmla[1] in ['x', 'y', 'z', 'w'] + constants and FirstOrderLogic(self.fmla[2:]).is_fmla()
+        return self.is_kind('ex')
 
     def is_binary_connective(self):
-        if not (self.fmla.startswith('(') and self.fmla.endswith(')')):
-            return None
-
-        brackets = 0
-        for i in range(1, len(self.fmla) - 1):
-            if self.fmla[i] == '(':
-                brackets += 1
-            elif self.fmla[i] == ')':
-                brackets -= 1
-            elif brackets == 0:
-                for conn in ['=>', '/\\', '\/']:
-                    if self.fmla[i:i+len(conn)] == conn:
-                        left = self.fmla[1:i]
-                        right = self.fmla[i+len(conn):-1]
-                        if FirstOrderLogic(left).is_fmla() and FirstOrderLogic(right).is_fmla():
-                            return left, conn, right
-        return None
+        return binary_parts(self.tree)
 
     def is_fmla(self):
-        if ' ' in self.fmla or not check_matching_brackets(self.fmla):
-            return False
-        return self.is_predicate() or self.is_negation() or self.is_universally_quantified() or self.is_existentially_quantified() or bool(self.is_binary_connective())
+        return self.tree is not None
 
     def parse(self):
         if not self.is_fmla():
             return 0
-        if self.is_predicate():
-            return 1
-        if self.is_negation():
-            return 2
-        if self.is_universally_quantified():
-            return 3
-        if self.is_existentially_quantified():
-            return 4
-        if self.is_binary_connective():
-            return 5
+        return {'pred': 1, 'neg': 2, 'all': 3, 'ex': 4, 'bin': 5}[self.tree.kind]
     
     def is_alpha(self):
-        if con(self.fmla) == '/\\':
-            return True
-        elif self.is_negation() and con(self.fmla[1:]) == '=>':
-            return True
-        elif self.is_negation() and con(self.fmla[1:]) == '\\/':
-            return True
+        return self.is_fmla() and is_alpha_node(self.tree)
         
     def is_beta(self):
-        if con(self.fmla) == '\\/':
-            return True
-        elif con(self.fmla) == '=>':
-            return True
-        elif self.is_negation() and con(self.fmla[1:]) == '/\\':
-            return True
+        return self.is_fmla() and is_beta_node(self.tree)
         
     def is_delta(self):
-        if self.is_existentially_quantified():
-            return True
-        elif self.is_negation() and FirstOrderLogic(self.fmla[1:]).is_universally_quantified():
-            return True
+        return self.is_fmla() and is_delta_node(self.tree)
         
     def is_gamma(self):
-        if self.is_universally_quantified():
-            return True
-        elif self.is_negation() and FirstOrderLogic(self.fmla[1:]).is_existentially_quantified():
-            return True
+        return self.is_fmla() and is_gamma_node(self.tree)
 
 def clean_negations(fmla):
     negations = 0
@@ -179,6 +281,169 @@ def clean_negations(fmla):
     else:
         return '~' + fmla
 
+def rename_variable(term, names):
+    if term not in VARIABLES:
+        return term
+    if term not in names:
+        names[term] = VARIABLES[len(names)]
+    return names[term]
+
+def canonical_tree(node, names):
+    negations = 0
+    while node.kind == 'neg':
+        negations += 1
+        node = node.left
+    if node.kind == 'pred':
+        node = Formula('pred', node.symbol, rename_variable(node.left, names), rename_variable(node.right, names))
+    elif node.kind in ['all', 'ex']:
+        variable = rename_variable(node.symbol, names)
+        node = Formula(node.kind, variable, canonical_tree(node.left, names), None)
+    elif node.kind == 'bin':
+        left = canonical_tree(node.left, names)
+        node = Formula('bin', node.symbol, left, canonical_tree(node.right, names))
+    if negations % 2 == 1:
+        node = Formula('neg', '~', node, None)
+    return node
+
+# Alpha-equivalent formulas, and formulas that differ only in double negations, have
+# the same canonical text. Variables are renamed in order of first occurrence, which
+# is a bijection on VARIABLES, so sat() gives the same answer for both.
+def canonical(fmla):
+    tree = proposition_tree(fmla) or first_order_tree(fmla)
+    if tree is None:
+        return clean_negations(fmla.strip())
+    return fmla_text(canonical_tree(tree, {}))
+
+TRUE = Formula('true', 'TRUE', None, None)
+FALSE = Formula('false', 'FALSE', None, None)
+MAX_FOLD_ATOMS = 6
+
+# Negation normal form: => is rewritten with ~ and \/, and negations are pushed down
+# to atoms and predicates with De Morgan's laws and the quantifier dualities. The
+# tableau ignores junk however it is negated, so junk becomes TRUE.
+def negation_normal_form(node, negated=False):
+    while node.kind == 'neg':
+        negated = not negated
+        node = node.left
+    if node.kind == 'junk':
+        return TRUE
+    if node.kind in ['atom', 'pred']:
+        return Formula('neg', '~', node, None) if negated else node
+    if node.kind in ['all', 'ex']:
+        kind = node.kind if not negated else 'ex' if node.kind == 'all' else 'all'
+        return Formula(kind, node.symbol, negation_normal_form(node.left, negated), None)
+    left = negation_normal_form(node.left, negated != (node.symbol == '=>'))
+    right = negation_normal_form(node.right, negated)
+    return Formula('bin', '/\\' if (node.symbol == '/\\') != negated else '\\/', left, right)
+
+def free_variables(node):
+    if node.kind == 'pred':
+        return {term for term in [node.left, node.right] if term in VARIABLES}
+    if node.kind == 'neg':
+        return free_variables(node.left)
+    if node.kind in ['all', 'ex']:
+        return free_variables(node.left) - {node.symbol}
+    if node.kind == 'bin':
+        return free_variables(node.left) | free_variables(node.right)
+    return set()
+
+def junctions(node, symbol):
+    if node.kind == 'bin' and node.symbol == symbol:
+        return junctions(node.left, symbol) + junctions(node.right, symbol)
+    return [node]
+
+# Joins parts with /\ or \/, dropping duplicates and TRUE/FALSE parts that make no
+# difference, and folding to TRUE/FALSE when one part decides the whole, including
+# when a literal and its negation are both parts.
+def junction(parts, symbol):
+    absorbing, neutral = (FALSE, TRUE) if symbol == '/\\' else (TRUE, FALSE)
+    kept = {}
+    for part in parts:
+        if part == absorbing:
+            return absorbing
+        if part != neutral:
+            kept[part] = True
+    for part in kept:
+        if part.kind == 'neg' and part.left in kept:
+            return absorbing
+    if not kept:
+        return neutral
+    parts = list(kept)
+    node = parts[0]
+    for part in parts[1:]:
+        node = Formula('bin', symbol, node, part)
+    return node
+
+def atom_masks(node, masks):
+    if node.kind in ['atom', 'pred']:
+        masks.setdefault(node, None)
+        return True
+    if node.kind == 'neg':
+        return atom_masks(node.left, masks)
+    if node.kind == 'bin':
+        return atom_masks(node.left, masks) and atom_masks(node.right, masks)
+    return node.kind in ['true', 'false']
+
+def truth_mask(node, masks, full):
+    if node.kind in ['atom', 'pred']:
+        return masks[node]
+    if node.kind == 'neg':
+        return full ^ truth_mask(node.left, masks, full)
+    if node.kind in ['true', 'false']:
+        return full if node.kind == 'true' else 0
+    left = truth_mask(node.left, masks, full)
+    right = truth_mask(node.right, masks, full)
+    return left & right if node.symbol == '/\\' else left | right
+
+# A quantifier free formula over a few atoms that is a tautology or a contradiction
+# under the truth table of its atoms, e.g. (P(x,y)=>P(x,y)), is TRUE or FALSE under
+# every instantiation of its variables too.
+def fold(node):
+    masks = {}
+    if not atom_masks(node, masks) or len(masks) > MAX_FOLD_ATOMS:
+        return None
+    valuations = 1 << len(masks)
+    for i, atom in enumerate(masks):
+        masks[atom] = sum(1 << v for v in range(valuations) if v >> i & 1)
+    mask = truth_mask(node, masks, (1 << valuations) - 1)
+    if mask == 0:
+        return FALSE
+    if mask == (1 << valuations) - 1:
+        return TRUE
+    return None
+
+# Pushes a quantifier into a body in negation normal form: Ax(A/\B) becomes
+# (AxA/\AxB), Ex(A\/B) becomes (ExA\/ExB), parts of the body the variable is not
+# free in are moved out of its scope, and a quantifier with nothing to bind is dropped.
+def miniscope(kind, var, body):
+    if var not in free_variables(body):
+        return body
+    if body.kind == 'bin':
+        parts = junctions(body, body.symbol)
+        if (kind == 'all') == (body.symbol == '/\\'):
+            return junction([miniscope(kind, var, part) for part in parts], body.symbol)
+        bound = [part for part in parts if var in free_variables(part)]
+        if len(bound) < len(parts):
+            rest = [part for part in parts if var not in free_variables(part)]
+            return junction([Formula(kind, var, junction(bound, body.symbol), None)] + rest, body.symbol)
+    return Formula(kind, var, body, None)
+
+def simplify(node):
+    if node.kind == 'bin':
+        folded = fold(node)
+        if folded is not None:
+            return folded
+        return junction([simplify(part) for part in junctions(node, node.symbol)], node.symbol)
+    if node.kind in ['all', 'ex']:
+        return miniscope(node.kind, node.symbol, simplify(node.left))
+    return node
+
+# The form sat() searches: negation normal form, simplified, so the tableau works on
+# smaller formulas whose negations are all on literals.
+@lru_cache(maxsize=4096)
+def preprocess(tree):
+    return simplify(negation_normal_form(tree))
+
 def check_matching_brackets(fmla):
     stack = []
     for elem in fmla:
@@ -195,330 +460,814 @@ def check_matching_brackets(fmla):
 def parse(fmla):
     if fmla[0:2] + fmla[3:] == "~()":
         return 0
-    if Proposition(fmla).is_fmla():
-        return Proposition(fmla).parse()
-    elif FirstOrderLogic(fmla).is_fmla():
-            return FirstOrderLogic(fmla).parse()
-    else:
-        return 0
+    proposition = Proposition(fmla)
+    if proposition.is_fmla():
+        return proposition.parse()
+    return FirstOrderLogic(fmla).parse()
+
+
+def split_binary(fmla):
+    tree = first_order_tree(fmla)
+    if tree is None:
+        tree = proposition_tree(fmla)
+    return binary_parts(tree) or ('', '', '')
 
 
 def lhs(fmla):
-    if FirstOrderLogic(fmla).is_fmla():
-        if FirstOrderLogic(fmla).is_binary_connective():
-            return FirstOrderLogic(fmla).is_binary_connective()[0]
-        else:
-            return ''
-    elif Proposition(fmla).is_fmla():
-        if Proposition(fmla).is_binary_connective():
-            return Proposition(fmla).is_binary_connective()[0]
-        else:
-            return ''
-    else:
-        return ''
+    return split_binary(fmla)[0]
 
-def lhsclean(fmla):
-    return clean_negations(lhs(fmla))
+def con(fmla):
+    return split_binary(fmla)[1]
 
-def rhsclean(fmla):
-    return clean_negations(rhs(fmla))
 
+def rhs(fmla):
+    return split_binary(fmla)[2]
 
-def con(fmla):
-    if FirstOrderLogic(fmla).is_fmla():
-        if FirstOrderLogic(fmla).is_binary_connective():
-            return FirstOrderLogic(fmla).is_binary_connective()[1]
-        else:
-            return ''
-    elif Proposition(fmla).is_fmla():
-        if Proposition(fmla).is_binary_connective():
-            return Proposition(fmla).is_binary_connective()[1]
+
+# Kinds and fixed symbols of the nodes in a FormulaTable, which stores their indexes
+# rather than the strings.
+NODE_KINDS = ['atom', 'pred', 'neg', 'all', 'ex', 'bin', 'junk', 'true', 'false']
+ATOM, PRED, NEG, ALL, EX, BIN, JUNK, VERUM, FALSUM = range(len(NODE_KINDS))
+FIXED_SYMBOLS = ['~', '/\\', '\\/', '=>']
+NOT, AND, OR, IMPLIES = range(len(FIXED_SYMBOLS))
+
+
+class FormulaTable:
+
+    # Interned formulas, stored column-wise: formula fid has kind kinds[fid], symbol
+    # symbols[syms[fid]] and children lefts[fid] and rights[fid], which are formula IDs,
+    # symbol indexes for the terms of a predicate, or -1. Each formula takes a few bytes
+    # in the arrays and an int key in ids instead of a Formula tuple in both.
+    def __init__(self):
+        self.generation = 0
+        self.clear()
+
+    # generation counts the clears, so holders of formula IDs can tell theirs are stale
+    def clear(self):
+        self.generation += 1
+        self.kinds = array('B')
+        self.syms = array('L')
+        self.lefts = array('l')
+        self.rights = array('l')
+        self.symbols = list(FIXED_SYMBOLS)
+        self.symbol_ids = {symbol: sid for sid, symbol in enumerate(FIXED_SYMBOLS)}
+        self.ids = {}
+        self.rules = []
+        self.literal_bits = array('l')
+        self.literal_ids = array('l')
+        self.negations = array('l')
+        self.substitutions = {}
+        self.false_id = None
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def symbol(self, text):
+        sid = self.symbol_ids.get(text)
+        if sid is None:
+            sid = self.symbol_ids[text] = len(self.symbols)
+            self.symbols.append(text)
+        return sid
+
+    def add(self, kind, sym, left=-1, right=-1):
+        key = (((sym << 32 | left + 1) << 32 | right + 1) << 4) | kind
+        fid = self.ids.get(key)
+        if fid is None:
+            fid = len(self.kinds)
+            self.ids[key] = fid
+            self.kinds.append(kind)
+            self.syms.append(sym)
+            self.lefts.append(left)
+            self.rights.append(right)
+            self.negations.append(-1)
+            self.rules.append(self.classify(fid))
+            bit = self.literal_bit(fid)
+            self.literal_bits.append(bit)
+            if bit >= 0:
+                self.literal_ids[bit] = fid
+            if kind == NEG:
+                self.negations[left] = fid
+            elif kind == FALSUM:
+                self.false_id = fid
+        return fid
+
+    def literal_bit(self, fid):
+        # an atom gets bit 2k and its negation bit 2k + 1, so complementary literals
+        # differ only in the lowest bit; -1 for formulas that are not literals
+        kind = self.kinds[fid]
+        if kind == ATOM or kind == PRED:
+            self.literal_ids.extend((-1, -1))
+            return len(self.literal_ids) - 2
+        if kind == NEG and self.kinds[self.lefts[fid]] in (ATOM, PRED):
+            return self.literal_bits[self.lefts[fid]] + 1
+        return -1
+
+    def intern(self, tree):
+        negations = 0
+        while tree.kind == 'neg':
+            negations += 1
+            tree = tree.left
+        kind = NODE_KINDS.index(tree.kind)
+        sym = self.symbol(tree.symbol)
+        if kind == ALL or kind == EX:
+            fid = self.add(kind, sym, self.intern(tree.left))
+        elif kind == BIN:
+            fid = self.add(kind, sym, self.intern(tree.left), self.intern(tree.right))
+        elif kind == PRED:
+            fid = self.add(kind, sym, self.symbol(tree.left), self.symbol(tree.right))
         else:
-            return ''
-    return ''
+            fid = self.add(kind, sym)
+        for _ in range(negations):
+            fid = self.negate(fid)
+        return fid
 
+    def classify(self, fid):
+        kind = self.kinds[fid]
+        if kind == NEG:
+            fid = self.lefts[fid]
+            kind = self.kinds[fid]
+            if kind == BIN:
+                return 'beta' if self.syms[fid] == AND else 'alpha'
+            return {ATOM: 'literal', PRED: 'literal', ALL: 'delta', EX: 'gamma'}.get(kind)
+        if kind == BIN:
+            return 'alpha' if self.syms[fid] == AND else 'beta'
+        return {ATOM: 'literal', PRED: 'literal', ALL: 'gamma', EX: 'delta'}.get(kind)
 
-def rhs(fmla):
-    if FirstOrderLogic(fmla).is_fmla():
-        if FirstOrderLogic(fmla).is_binary_connective():
-            return FirstOrderLogic(fmla).is_binary_connective()[2]
+    def negate(self, fid):
+        return self.add(NEG, NOT, fid)
+
+    def clean(self, fid):
+        kinds, lefts = self.kinds, self.lefts
+        while kinds[fid] == NEG and kinds[lefts[fid]] == NEG:
+            fid = lefts[lefts[fid]]
+        return fid
+
+    def complement(self, fid):
+        if self.kinds[fid] == NEG:
+            return self.lefts[fid]
+        negation = self.negations[fid]
+        return None if negation < 0 else negation
+
+    # var and term are symbol indexes
+    def substitute(self, fid, var, term):
+        key = (fid << 32 | var) << 32 | term
+        result = self.substitutions.get(key)
+        if result is None:
+            kind, sym, left, right = self.kinds[fid], self.syms[fid], self.lefts[fid], self.rights[fid]
+            if kind == PRED:
+                result = self.add(PRED, sym, term if left == var else left, term if right == var else right)
+            elif (kind == ALL or kind == EX) and sym == var:
+                result = fid
+            elif kind == NEG or kind == ALL or kind == EX:
+                result = self.add(kind, sym, self.substitute(left, var, term))
+            elif kind == BIN:
+                result = self.add(BIN, sym, self.substitute(left, var, term), self.substitute(right, var, term))
+            else:
+                result = fid
+            self.substitutions[key] = result
+        return result
+
+    def expand(self, fid):
+        if self.kinds[fid] == BIN:
+            left, right = self.lefts[fid], self.rights[fid]
+            if self.syms[fid] == IMPLIES:
+                left = self.negate(left)
         else:
-            return ''
-    elif Proposition(fmla).is_fmla():
-        if Proposition(fmla).is_binary_connective():
-            return Proposition(fmla).is_binary_connective()[2]
+            child = self.lefts[fid]
+            left, right = self.negate(self.lefts[child]), self.negate(self.rights[child])
+            if self.syms[child] == IMPLIES:
+                left = self.lefts[child]
+        return self.clean(left), self.clean(right)
+
+    def instantiate(self, fid, term):
+        term = self.symbol(term)
+        if self.kinds[fid] == NEG:
+            quantified = self.lefts[fid]
+            body = self.substitute(self.lefts[quantified], self.syms[quantified], term)
+            return self.clean(self.negate(body))
+        return self.clean(self.substitute(self.lefts[fid], self.syms[fid], term))
+
+    def text(self, fid):
+        return fmla_text(self.tree(fid))
+
+    def tree(self, fid):
+        kind, symbol, left, right = self.kinds[fid], self.symbols[self.syms[fid]], self.lefts[fid], self.rights[fid]
+        if kind == NEG or kind == ALL or kind == EX:
+            return Formula(NODE_KINDS[kind], symbol, self.tree(left), None)
+        if kind == BIN:
+            return Formula('bin', symbol, self.tree(left), self.tree(right))
+        if kind == PRED:
+            return Formula('pred', symbol, self.symbols[left], self.symbols[right])
+        return Formula(NODE_KINDS[kind], symbol, None, None)
+
+
+formula_table = FormulaTable()
+
+
+# Formula trees, e.g. from a snapshot (see snapshot.py), are taken as already preprocessed.
+def search_tree(fmla):
+    if isinstance(fmla, Formula):
+        return fmla
+    tree = proposition_tree(fmla) or first_order_tree(fmla)
+    if tree is None:
+        return Formula('junk', fmla.strip(), None, None)
+    return preprocess(tree)
+
+def formula_id(fmla):
+    return formula_table.clean(formula_table.intern(search_tree(fmla)))
+
+
+RULES = ['alpha', 'delta', 'beta', 'gamma']
+
+
+class RuleQueue:
+    __slots__ = ['top', 'bottom']
+
+    # A persistent queue of formulas waiting for one tableau rule. New formulas go on
+    # top and are expanded first; formulas pushed to the back (gamma formulas that have
+    # just been instantiated, and their instances) wait until everything else is done.
+    # Both ends are cons cells, so siblings share whatever they have not popped yet.
+    def __init__(self, top=None, bottom=None):
+        if top is None and bottom is not None:
+            while bottom is not None:
+                top = (bottom[0], top)
+                bottom = bottom[1]
+        self.top = top
+        self.bottom = bottom
+
+    def __bool__(self):
+        return self.top is not None
+
+    def peek(self):
+        return self.top[0]
+
+    def pop(self):
+        return RuleQueue(self.top[1], self.bottom)
+
+    def push(self, fmla):
+        return RuleQueue((fmla, self.top), self.bottom)
+
+    def push_back(self, fmla):
+        return RuleQueue(self.top, (fmla, self.bottom))
+
+    # pop() then push_back(fmla), without the queue in between
+    def rotate(self, fmla):
+        return RuleQueue(self.top[1], (fmla, self.bottom))
+
+
+EMPTY_QUEUE = RuleQueue()
+
+
+class Branch:
+    __slots__ = ['parent', 'depth', 'origin', 'added', 'literals', 'closed', 'clash', 'waiting', 'used',
+                 'domain', 'parked'] + RULES
+
+    # A branch only stores the formulas it adds on top of its parent. Literals are
+    # kept as a bitset that children share until they add a literal of their own,
+    # and every other formula waits in the queue of the rule that expands it.
+    # origin is the formula whose expansion created the branch; waiting and used
+    # track its children for the ClosureCache once it has been expanded. Constants are
+    # introduced in the order of constant_name(), so the domain of a branch is its
+    # first domain names. Entries of the gamma queue are gamma_entry()s that also count
+    # how many of them the gamma formula has been instantiated with, and parked holds
+    # the entries of the gamma formulas that have used the whole domain and wait for a
+    # new constant.
+    def __init__(self, parent=None):
+        self.parent = parent
+        self.depth = parent.depth + 1 if parent else 0
+        self.origin = None
+        self.added = ()
+        self.literals = parent.literals if parent else 0
+        self.closed = parent.closed if parent else False
+        self.clash = parent.clash if parent else None
+        self.waiting = None
+        self.used = None
+        self.domain = parent.domain if parent else 0
+        self.parked = parent.parked if parent else ()
+        for rule in RULES:
+            setattr(self, rule, getattr(parent, rule) if parent else EMPTY_QUEUE)
+
+    def __contains__(self, fmla):
+        bit = formula_table.literal_bits[fmla]
+        if bit >= 0:
+            return self.literals >> bit & 1 == 1
+        branch = self
+        while branch is not None:
+            if fmla in branch.added:
+                return True
+            branch = branch.parent
+        return False
+
+    def add(self, fmla, back=False):
+        if fmla in self:
+            return
+        self.added += (fmla,)
+        bit = formula_table.literal_bits[fmla]
+        if bit >= 0:
+            if self.literals >> (bit ^ 1) & 1 and not self.closed:
+                self.closed = True
+                self.clash = (fmla, formula_table.literal_ids[bit ^ 1])
+            self.literals |= 1 << bit
+            return
+        rule = formula_table.rules[fmla]
+        if rule is not None:
+            queue = getattr(self, rule)
+            setattr(self, rule, queue.push_back(fmla) if back else queue.push(fmla))
+        elif fmla == formula_table.false_id and not self.closed:
+            self.closed = True
+            self.clash = (fmla,)
+
+    def extend(self, fmlas, done=None):
+        branch = Branch(self)
+        branch.origin = done
+        if done is not None:
+            rule = formula_table.rules[done]
+            setattr(branch, rule, getattr(branch, rule).pop())
+        for fmla in fmlas:
+            branch.add(fmla)
+        return branch
+
+    def requeue(self, instance):
+        entry = self.gamma.peek()
+        branch = Branch(self)
+        branch.origin = entry & FORMULA_MASK
+        if formula_table.rules[instance] == 'gamma':
+            branch.gamma = self.gamma.pop()
+            branch.add(instance, back=True)
+            branch.gamma = branch.gamma.push_back(entry + PROGRESS_STEP)
         else:
-            return ''
-    return '' 
+            branch.gamma = self.gamma.rotate(entry + PROGRESS_STEP)
+            branch.add(instance, back=True)
+        return branch
+
+    def park(self):
+        branch = Branch(self)
+        branch.origin = self.gamma.peek() & FORMULA_MASK
+        branch.gamma = self.gamma.pop()
+        branch.parked += (self.gamma.peek(),)
+        return branch
+
+    def add_constant(self):
+        self.domain += 1
+        for gamma in self.parked:
+            self.gamma = self.gamma.push_back(gamma)
+        self.parked = ()
 
 
 def theory(fmla):
     return [fmla]
 
 def expanded(branch):
-    for fmla in branch:
-        fmla = clean_negations(fmla)
-
-        if Proposition(fmla).is_fmla() and Proposition(fmla).is_binary_connective() or (Proposition(fmla).is_fmla() and Proposition(fmla).is_negation() and Proposition(fmla[1:]).is_binary_connective()):
-            return False  
-        elif (FirstOrderLogic(fmla).is_fmla() and FirstOrderLogic(fmla).is_binary_connective()) or (FirstOrderLogic(fmla).is_fmla() and FirstOrderLogic(fmla).is_negation() and FirstOrderLogic(fmla[1:]).is_binary_connective()) or (FirstOrderLogic(fmla).is_fmla() and FirstOrderLogic(fmla).is_universally_quantified()) or (FirstOrderLogic(fmla).is_fmla() and FirstOrderLogic(fmla).is_existentially_quantified()) or (FirstOrderLogic(fmla).is_fmla() and FirstOrderLogic(fmla).is_negation() and FirstOrderLogic(fmla[1:]).is_universally_quantified()) or (FirstOrderLogic(fmla).is_fmla() and FirstOrderLogic(fmla).is_negation() and FirstOrderLogic(fmla[1:]).is_existentially_quantified()):
-            return False 
-        
-    return True
+    return not (branch.alpha or branch.delta or branch.beta or branch.gamma)
 
 def contradictory(branch):
-    for fmla in branch:
-        if Proposition(fmla).is_fmla():
-            if Proposition(fmla).is_proposition():
-                if fmla in branch and '~'+fmla in branch:
-                    return True
-            if Proposition(fmla).is_negation():
-                if fmla in branch and fmla[1:] in branch:
-                    return True
-        elif FirstOrderLogic(fmla).is_fmla(): 
-            if FirstOrderLogic(fmla).is_predicate():
-                if fmla in branch and '~'+fmla in branch:
-                    return True
-            if FirstOrderLogic(fmla).is_negation() and FirstOrderLogic(fmla[1:]).is_predicate():
-                if fmla in branch and fmla[1:] in branch:
-                    return True
-    return False
+    return branch.closed
 
 def pick_non_literal(branch):
-    for fmla in reversed(branch):
-        if FirstOrderLogic(fmla).is_fmla():
-            if FirstOrderLogic(fmla).is_alpha():
-                return fmla
-    
-    for fmla in reversed(branch):
-        if FirstOrderLogic(fmla).is_fmla():
-            if FirstOrderLogic(fmla).is_delta():
-                return fmla
-            
-    for fmla in reversed(branch):
-        if FirstOrderLogic(fmla).is_fmla():
-            if FirstOrderLogic(fmla).is_beta():
-                return fmla
-            
-    for fmla in reversed(branch):
-        if FirstOrderLogic(fmla).is_fmla():
-            if FirstOrderLogic(fmla).is_gamma():
-                return fmla
-            
-    for fmla in reversed(branch):
-        if Proposition(fmla).is_fmla():
-            if Proposition(fmla).is_binary_connective():
-                return fmla
-            if Proposition(fmla).is_negation() and Proposition(fmla[1:]).is_binary_connective():
-                return fmla
-        elif FirstOrderLogic(fmla).is_fmla():
-            if FirstOrderLogic(fmla).is_binary_connective():
-                return fmla
-            if FirstOrderLogic(fmla).is_negation() and (FirstOrderLogic(fmla[1:]).is_binary_connective() or FirstOrderLogic(fmla[1:]).is_universally_quantified() or FirstOrderLogic(fmla[1:]).is_existentially_quantified):
-                return fmla
-            if FirstOrderLogic(fmla).is_universally_quantified():
-                return fmla
-            if FirstOrderLogic(fmla).is_existentially_quantified():
-                return fmla
+    for rule in RULES:
+        queue = getattr(branch, rule)
+        if queue:
+            return queue.peek() & FORMULA_MASK
     return None
 
-def pick_new_constant():
-    for i in 'abcdefghijklmnotuv':
-        if i not in constants:
-            constants.append(i)
-            return i
+# A gamma queue entry is a gamma formula's ID with the number of constants it has
+# been instantiated with in the bits above FORMULA_MASK, so counting an instance
+# changes the entry rather than a per-branch table.
+FORMULA_MASK = (1 << 32) - 1
+PROGRESS_STEP = 1 << 32
 
-def replace_variable_in_scope(fmla, old_var, new_var):
+def gamma_progress(entry):
+    return entry >> 32
+
+CONSTANT_NAMES = 'abcdefghijklmnotuv'
+
+def constant_name(k):
+    name = CONSTANT_NAMES[k % len(CONSTANT_NAMES)]
+    return name if k < len(CONSTANT_NAMES) else name + str(k // len(CONSTANT_NAMES))
+
+def pick_new_constant(branch, budget):
+    if branch.domain >= budget.constants:
+        return None
+    return constant_name(branch.domain)
+
+
+class Budget:
+
+    # Limits on a single sat() call; None means unlimited. constants bounds the domain
+    # of each branch, and a branch that needs more is set aside as undecided while the
+    # others are still searched. nodes (rule applications), seconds (wall-clock time)
+    # and branches (open branches in the frontier, which is what the memory held by the
+    # search grows with) bound the whole search, which gives up once one runs out.
+    def __init__(self, constants=None, nodes=None, seconds=None, branches=None):
+        self.constants = float('inf') if constants is None else constants
+        self.nodes = nodes
+        self.seconds = seconds
+        self.branches = branches
 
-    if len(fmla) < 3 or fmla[1] != old_var or fmla[0] not in ['A', 'E']:
-        return fmla
- 
-    scope = fmla[2:]  
 
-    modified_scope = scope.replace(old_var, new_var)
+class ClosureCache:
 
-    return modified_scope
+    # When every child of an expanded branch has closed, the formulas the closures
+    # actually relied on form an unsatisfiable core of that branch: the clashing
+    # literals, with each formula a rule added replaced by the formula it came from.
+    # Cores are remembered for the rest of the search and any new branch containing
+    # one is closed without being explored. Cores made only of literals are not kept
+    # since such a core always contains a clash the literal bitset already catches.
+    def __init__(self, maxsize=256):
+        self.cores = deque(maxlen=maxsize)
+        self.pruned = 0
+        self.closed = 0
 
-def pick_next_constant(last_constant = None):
-    if last_constant:
-        next_idx = constants.index(last_constant) + 1
-        if next_idx < len(constants):
-            return constants[next_idx]
+    def remember(self, used):
+        literals = 0
+        fmlas = []
+        for fmla in used:
+            bit = formula_table.literal_bits[fmla]
+            if bit < 0:
+                fmlas.append(fmla)
+            else:
+                literals |= 1 << bit
+        if fmlas:
+            self.cores.append((literals, fmlas, used))
+
+    def prune(self, branch):
+        for literals, fmlas, used in reversed(self.cores):
+            if branch.literals & literals == literals and all(fmla in branch for fmla in fmlas):
+                self.pruned += 1
+                return used
+        return None
+
+    def close(self, branch, used, known=False):
+        self.closed += 1
+        while True:
+            if not known:
+                self.remember(used)
+            known = False
+            parent = branch.parent
+            if parent is None or parent.waiting is None:
+                return
+            lifted = {fmla for fmla in used if fmla not in branch.added}
+            if len(lifted) < len(used):
+                lifted.add(branch.origin)
+            parent.used = lifted if parent.used is None else parent.used | lifted
+            parent.waiting -= 1
+            if parent.waiting > 0:
+                return
+            branch, used = parent, parent.used
+
+
+def push(tableau, closures, branch, children, front=False):
+    branch.waiting = len(children)
+    for child in children:
+        if contradictory(child):
+            closures.close(child, set(child.clash))
+            continue
+        core = closures.prune(child)
+        if core is not None:
+            closures.close(child, core, known=True)
+        elif front:
+            tableau.appendleft(child)
         else:
-            return None
-    if not last_constant and len(constants) > 0:
-        return constants[0]
-    return pick_new_constant()
+            tableau.append(child)
 
-global constants
-constants = []
 
+# Set by instrument.Instrumentation.enable() to observe every search started after it.
+instrumentation = None
 
-def sat(tableau):
-    last_constant_used = {}
-    global constants
-    constants = []
-    while tableau:
-        branch = tableau.pop()
-        if expanded(branch) and not contradictory(branch):
-            return 1
+Progress = namedtuple('Progress', ['open', 'closed', 'nodes', 'constants'])
+
+# What an open, fully expanded branch says about its formulas: the truth value of
+# every atom and predicate it has a literal for (those it has none for may be
+# either), and the constants it introduced, which are the domain of the model.
+Model = namedtuple('Model', ['assignments', 'constants'])
+
+
+def branch_model(branch):
+    assignments = {}
+    bits = branch.literals
+    while bits:
+        bit = (bits & -bits).bit_length() - 1
+        assignments[formula_table.text(formula_table.literal_ids[bit & ~1])] = bit & 1 == 0
+        bits &= bits - 1
+    return Model(assignments, [constant_name(k) for k in range(branch.domain)])
+
+
+def default_budget():
+    return Budget(MAX_CONSTANTS, MAX_NODES, MAX_SECONDS, MAX_BRANCHES)
+
+
+class TableauSolver:
+
+    # One sat() search that can be run a piece at a time. step() applies one rule and
+    # run() keeps stepping for a number of steps or seconds; both return the sat() code
+    # once the search has finished and None while it can still be resumed. The Budget
+    # is for the whole search however it is split up, and cancel() (safe to call from
+    # another thread) ends it with 2 at the next step. Solvers share the module's
+    # formula table, so only interleave them from a single thread. Each branch of the
+    # tableau extends start, and closures may be shared with earlier searches whose
+    # cores are still valid (see Theory).
+    def __init__(self, tableau, budget=None, start=None, closures=None):
+        if budget is None:
+            budget = default_budget()
+        self.budget = budget
+        self.deadline = None if budget.seconds is None else time.monotonic() + budget.seconds
+        self.nodes = 0
+        self.constants = 0
+        self.undecided = False
+        self.cancelled = False
+        self.result = None
+        self.witness = None
+        self.closures = ClosureCache() if closures is None else closures
+        if start is None:
+            start = Branch()
+        self.frontier = deque(start.extend(formula_id(fmla) for fmla in branch) for branch in tableau)
+        self.stats = instrumentation
+        if self.stats is not None:
+            self.stats.start(self)
+
+    def progress(self):
+        return Progress(len(self.frontier), self.closures.closed, self.nodes, self.constants)
+
+    def cancel(self):
+        self.cancelled = True
+
+    # Model read off the open branch that made the result 1, or None
+    def model(self):
+        return None if self.witness is None else branch_model(self.witness)
+
+    def finish(self, result):
+        self.result = result
+        if self.stats is not None:
+            self.stats.finish(self, result)
+        return result
+
+    def new_constant(self, branch):
+        term = pick_new_constant(branch, self.budget)
+        if term is None:
+            self.undecided = True
         else:
-            fmla = pick_non_literal(branch)
-            if fmla:
-                fmla_index = branch.index(fmla)
-                fmla = clean_negations(fmla)
-                branch[fmla_index] = fmla
-
-
-                if Proposition(fmla).is_fmla():
-                    
-                    if Proposition(fmla).is_alpha():
-                        if con(fmla) == '/\\':
-                            branch.remove(fmla)
-                            branch = branch + [lhsclean(fmla), rhsclean(fmla)]
-                            if not contradictory(branch) and branch not in tableau:
-                                tableau.append(branch)
-                        elif Proposition(fmla).is_negation() and con(fmla[1:]) == '=>':
-                            branch.remove(fmla)
-                            branch = branch + [lhsclean(fmla[1:]), clean_negations('~' + rhsclean(fmla[1:]))]
-                            if not contradictory(branch) and branch not in tableau:
-                                tableau.append(branch)
-                        elif Proposition(fmla).is_negation() and con(fmla[1:]) == '\\/':
-                            branch.remove(fmla)
-                            branch = branch + [clean_negations('~' + lhsclean(fmla[1:])), clean_negations('~' + rhsclean(fmla[1:]))]
-                            if not contradictory(branch) and branch not in tableau:
-                                tableau.append(branch)
-                    elif Proposition(fmla).is_beta():
-                            branch.remove(fmla)
-                            if con(fmla) == '\\/':
-                                new_branch1 = branch + [lhsclean(fmla)]
-                                new_branch2 = branch + [rhsclean(fmla)]
-                                if not contradictory(new_branch1) and new_branch1 not in tableau:
-                                    tableau.append(new_branch1)
-                                if not contradictory(new_branch2) and new_branch2 not in tableau:
-                                    tableau.append(new_branch2)
-
-                            elif con(fmla) == '=>':
-                                new_branch1 = branch + [clean_negations('~' + lhsclean(fmla))]
-                                new_branch2 = branch + [rhsclean(fmla)]
-                                if not contradictory(new_branch1) and new_branch1 not in tableau:
-                                    tableau.append(new_branch1)
-                                if not contradictory(new_branch2) and new_branch2 not in tableau:
-                                    tableau.append(new_branch2)
-
-                            elif Proposition(fmla).is_negation() and con(fmla[1:]) == '/\\':
-                                new_branch1 = branch + [clean_negations('~' + lhsclean(fmla[1:]))]
-                                new_branch2 = branch + [clean_negations('~' + rhsclean(fmla[1:]))]
-                                if not contradictory(new_branch1) and new_branch1 not in tableau:
-                                    tableau.append(new_branch1)
-                                if not contradictory(new_branch2) and new_branch2 not in tableau:
-                                    tableau.append(new_branch2)
-
-                elif FirstOrderLogic(fmla).is_fmla():
-                    if FirstOrderLogic(fmla).is_alpha():                        
-                        if con(fmla) == '/\\':
-                            branch.remove(fmla)
-                            branch = branch + [lhsclean(fmla), rhsclean(fmla)]
-                            if not contradictory(branch) and branch not in tableau:
-                                tableau.append(branch)
-                        elif FirstOrderLogic(fmla).is_negation() and con(fmla[1:]) == '=>':
-                            branch.remove(fmla)
-                            branch = branch + [lhsclean(fmla[1:]), clean_negations('~' + rhsclean(fmla[1:]))]
-                            if not contradictory(branch) and branch not in tableau:
-                                tableau.append(branch)
-                        elif FirstOrderLogic(fmla).is_negation() and con(fmla[1:]) == '\\/':
-                            branch.remove(fmla)
-                            branch = branch + [clean_negations('~' + lhsclean(fmla[1:])), clean_negations('~' + rhsclean(fmla[1:]))]
-                            if not contradictory(branch) and branch not in tableau:
-                                tableau.append(branch)
-
-                    elif FirstOrderLogic(fmla).is_beta():
-                            branch.remove(fmla)
-                            if con(fmla) == '\\/':
-                                new_branch1 = branch + [lhsclean(fmla)]
-                                new_branch2 = branch + [rhsclean(fmla)]
-                                if not contradictory(new_branch1) and new_branch1 not in tableau:
-                                    tableau.append(new_branch1)
-                                if not contradictory(new_branch2) and new_branch2 not in tableau:
-                                    tableau.append(new_branch2)
-
-                            elif con(fmla) == '=>':
-                                new_branch1 = branch + [clean_negations('~' + lhsclean(fmla))]
-                                new_branch2 = branch + [rhsclean(fmla)]
-                                if not contradictory(new_branch1) and new_branch1 not in tableau:
-                                    tableau.append(new_branch1)
-                                if not contradictory(new_branch2) and new_branch2 not in tableau:
-                                    tableau.append(new_branch2)
-
-                            elif FirstOrderLogic(fmla).is_negation() and con(fmla[1:]) == '/\\':
-                                new_branch1 = branch + [clean_negations('~' + lhsclean(fmla[1:]))]
-                                new_branch2 = branch + [clean_negations('~' + rhsclean(fmla[1:]))]
-                                if not contradictory(new_branch1) and new_branch1 not in tableau:
-                                    tableau.append(new_branch1)
-                                if not contradictory(new_branch2) and new_branch2 not in tableau:
-                                    tableau.append(new_branch2)
-
-                    elif FirstOrderLogic(fmla).is_delta():
-                        if len(constants) > MAX_CONSTANTS:
-                            return 2
-                        if FirstOrderLogic(fmla).is_existentially_quantified():
-                            branch.remove(fmla)
-                            fmla = replace_variable_in_scope(fmla, fmla[1], pick_new_constant())
-                            branch = branch + [fmla]
-                            if not contradictory(branch) and branch not in tableau:
-                                tableau.append(branch)
-                        elif FirstOrderLogic(fmla).is_negation() and FirstOrderLogic(fmla[1:]).is_universally_quantified():
-                            branch.remove(fmla)
-                            fmla = replace_variable_in_scope(fmla[1:], fmla[2], pick_new_constant())
-                            branch = branch + [clean_negations('~' + fmla)]
-                            if not contradictory(branch) and branch not in tableau:
-                                tableau.append(branch)
-
-                    elif FirstOrderLogic(fmla).is_gamma():
-
-                        if len(constants) > MAX_CONSTANTS:
-                            return 2
-                        if FirstOrderLogic(fmla).is_universally_quantified():
-                            quantified_var = fmla[1]
-                            last_constant = None
-                            if fmla in last_constant_used:
-                                last_constant = last_constant_used[fmla]
-                            new_term = pick_next_constant(last_constant)
-                            if new_term is None:
-                                branch.remove(fmla)
-                                tableau.insert(0, branch)
-                                continue
-                            last_constant_used[fmla] = new_term
-                            instantiated_fmla = replace_variable_in_scope(fmla, quantified_var, new_term)
-                            if instantiated_fmla not in branch:
-                                branch.insert(0, instantiated_fmla)
-                            branch.remove(fmla)
-                            branch.insert(0, fmla)
-                            if not contradictory(branch) and branch not in tableau:
-                                tableau.insert(0, branch)
-                        elif FirstOrderLogic(fmla).is_negation() and FirstOrderLogic(fmla[1:]).is_existentially_quantified():
-                            quantified_var = fmla[2]
-                            last_constant = None
-                            if fmla in last_constant_used:
-                                last_constant = last_constant_used[fmla]
-                            new_term = pick_next_constant(last_constant)
-                            if new_term is None:
-                                branch.remove(fmla)
-                                tableau.insert(0, branch)
-                                continue
-                            last_constant_used[fmla] = new_term
-                            instantiated_fmla = replace_variable_in_scope(fmla, quantified_var, new_term)
-                            if instantiated_fmla not in branch:
-                                branch.insert(0, instantiated_fmla)
-                            branch.remove(fmla)
-                            branch.insert(0, fmla)
-                            if not contradictory(branch) and branch not in tableau:
-                                tableau.insert(0, branch)
-                                
-    return 0
+            self.constants += 1
+        return term
 
-#DO NOT MODIFY THE CODE BELOW
-f = open('input.txt')
+    def step(self):
+        if self.result is not None:
+            return self.result
+        if self.cancelled:
+            return self.finish(2)
+        if not self.frontier:
+            return self.finish(2 if self.undecided else 0)
+        tableau, closures, budget = self.frontier, self.closures, self.budget
+        branch = tableau.pop()
+        if contradictory(branch):
+            closures.close(branch, set(branch.clash))
+            return None
+        if expanded(branch):
+            self.witness = branch
+            return self.finish(1)
+        self.nodes += 1
+        if budget.nodes is not None and self.nodes > budget.nodes:
+            return self.finish(2)
+        if budget.branches is not None and len(tableau) >= budget.branches:
+            return self.finish(2)
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            return self.finish(2)
+        fmla = pick_non_literal(branch)
+        rule = formula_table.rules[fmla]
+        if self.stats is not None:
+            self.stats.expand(self, branch, fmla, rule)
+
+        if rule == 'alpha':
+            push(tableau, closures, branch, [branch.extend(formula_table.expand(fmla), done=fmla)])
+
+        elif rule == 'beta':
+            left, right = formula_table.expand(fmla)
+            children = [branch.extend([left], done=fmla)]
+            if right != left:
+                children.append(branch.extend([right], done=fmla))
+            push(tableau, closures, branch, children)
+
+        elif rule == 'delta':
+            new_term = self.new_constant(branch)
+            if new_term is None:
+                return None
+            child = branch.extend([formula_table.instantiate(fmla, new_term)], done=fmla)
+            child.add_constant()
+            push(tableau, closures, branch, [child])
+
+        elif rule == 'gamma':
+            # Gamma formulas take turns: each is instantiated with the next constant of
+            # the branch's domain and goes to the back of the queue, and one that has
+            # used the whole domain is parked until the branch gets a new constant.
+            used = gamma_progress(branch.gamma.peek())
+            if used < branch.domain:
+                new_term = constant_name(used)
+            elif branch.domain:
+                push(tableau, closures, branch, [branch.park()], front=True)
+                return None
+            else:
+                new_term = self.new_constant(branch)
+                if new_term is None:
+                    return None
+            child = branch.requeue(formula_table.instantiate(fmla, new_term))
+            if used == branch.domain:
+                child.add_constant()
+            push(tableau, closures, branch, [child], front=True)
+
+        return None
+
+    def run(self, steps=None, seconds=None):
+        stop = None if seconds is None else time.monotonic() + seconds
+        while self.result is None:
+            if steps is not None:
+                if steps <= 0:
+                    break
+                steps -= 1
+            if stop is not None and time.monotonic() > stop:
+                break
+            self.step()
+        return self.result
+
+    # Runs the search in slices of steps, yielding to the event loop between them, so
+    # other tasks keep running and cancelling the awaiting task stops the search.
+    async def run_async(self, steps=256):
+        try:
+            while self.run(steps) is None:
+                await asyncio.sleep(0)
+        except asyncio.CancelledError:
+            self.cancel()
+            self.finish(2)
+            raise
+        return self.result
+
+
+def tableau_sat(tableau, budget=None):
+    if FIRST_ORDER_ENGINE == 'free-variable':
+        result = free_variable_sat([[search_tree(fmla) for fmla in branch] for branch in tableau],
+                                   default_budget() if budget is None else budget)
+        if result != 2:
+            return result
+    if len(formula_table) > MAX_TABLE_SIZE:
+        formula_table.clear()
+    return TableauSolver(tableau, budget).run()
+
+
+# Applies the alpha and delta rules of branch, which never split it, for as long as
+# it has any and stays open.
+def expand_linear(branch, budget=None):
+    budget = default_budget() if budget is None else budget
+    while not branch.closed and (branch.alpha or branch.delta):
+        if branch.alpha:
+            fmla = branch.alpha.peek()
+            branch = branch.extend(formula_table.expand(fmla), done=fmla)
+            continue
+        fmla = branch.delta.peek()
+        new_term = pick_new_constant(branch, budget)
+        if new_term is None:
+            break
+        branch = branch.extend([formula_table.instantiate(fmla, new_term)], done=fmla)
+        branch.add_constant()
+    return branch
+
+
+class Theory:
+
+    # Premises checked together against many queries. The premises are parsed once and
+    # their alpha and delta rules, which never split a branch, are applied once; each
+    # check then starts from a child of the resulting branch, sharing everything done
+    # for the premises, and the cores learned by one check prune the next. When the
+    # premises and the formulas checked are all propositional, the truth table mask of
+    # the premises is reused instead.
+    def __init__(self, premises, budget=None):
+        self.premises = list(premises)
+        self.budget = budget
+        self.prepare()
+
+    def prepare(self):
+        trees = [proposition_tree(fmla) for fmla in self.premises]
+        self.mask = branch_mask(trees) if all(tree is not None for tree in trees) else None
+        self.generation = formula_table.generation
+        self.closures = ClosureCache()
+        self.branch = expand_linear(Branch().extend(formula_id(fmla) for fmla in self.premises), self.budget)
+
+    # sat() code of the premises together with fmlas
+    def sat(self, fmlas=()):
+        fmlas = list(fmlas)
+        if self.mask is not None:
+            trees = [proposition_tree(fmla) for fmla in fmlas]
+            if all(tree is not None for tree in trees):
+                return 1 if self.mask & branch_mask(trees) else 0
+        if self.generation != formula_table.generation:
+            self.prepare()
+        return TableauSolver([fmlas], self.budget, self.branch, self.closures).run()
+
+    # 1 if the premises entail query, 0 if they do not and 2 if that is not known
+    def entails(self, query):
+        return [1, 0, 2][self.sat(['~' + query.strip()])]
+
+
+class Frame:
+    __slots__ = ['fmla', 'branch', 'result', 'witness']
+
+    def __init__(self, fmla, branch, result=None, witness=None):
+        self.fmla = fmla
+        self.branch = branch
+        self.result = result
+        self.witness = witness
+
+
+class IncrementalSolver:
+
+    # Formulas pushed and popped like a stack; check() gives the sat() code of all of
+    # them together. Each pushed formula gets a frame holding the branch of the ones
+    # below with it added and its alpha and delta rules applied, so a check searches
+    # from the top frame only and a pop goes back to the frame below as it was. The
+    # checks share one ClosureCache, since a core is unsatisfiable whatever else is
+    # pushed. When a check finds an open branch it is kept: after a push, that branch
+    # with the new formula added is searched first, as a small edit usually leaves
+    # the old model nearly right, and after a pop it still shows what is left
+    # satisfiable without any search.
+    def __init__(self, budget=None):
+        self.budget = budget
+        self.reset()
+
+    def reset(self, fmlas=()):
+        self.generation = formula_table.generation
+        self.closures = ClosureCache()
+        self.frames = [Frame(None, Branch(), 1, Branch())]
+        for fmla in fmlas:
+            self.push(fmla)
+
+    def __len__(self):
+        return len(self.frames) - 1
+
+    # formula IDs held in the frames are stale once the formula table is cleared
+    def refresh(self):
+        if self.generation != formula_table.generation:
+            self.reset([frame.fmla for frame in self.frames[1:]])
+
+    def push(self, fmla):
+        self.refresh()
+        branch = expand_linear(self.frames[-1].branch.extend([formula_id(fmla)]), self.budget)
+        self.frames.append(Frame(fmla, branch))
+
+    def pop(self):
+        if len(self.frames) == 1:
+            raise IndexError('pop from an empty IncrementalSolver')
+        frame = self.frames.pop()
+        below = self.frames[-1]
+        if frame.result == 1 and below.result is None:
+            below.result, below.witness = 1, frame.witness
+        return frame.fmla
+
+    def check(self):
+        self.refresh()
+        frame = self.frames[-1]
+        if frame.result is None:
+            solver = TableauSolver([[]], self.budget, frame.branch, self.closures)
+            witness = self.frames[-2].witness
+            if witness is not None:
+                # the old witness was never expanded, so closures of the branches
+                # grown from it are not lifted into the search that found it
+                solver.frontier.append(witness.extend([formula_id(frame.fmla)]))
+            frame.result = solver.run()
+            frame.witness = solver.witness
+        return frame.result
+
+    # Model of all the pushed formulas, or None if check() does not give 1
+    def model(self):
+        if self.check() != 1:
+            return None
+        return branch_model(self.frames[-1].witness)
+
+
+# Purely propositional tableaux are decided from their truth tables: with only four
+# propositions every formula is a 16 bit mask of the valuations satisfying it (see
+# truthtable.py), which gives the same 0/1 codes without growing any branches.
+def sat(tableau, budget=None):
+    trees = [[proposition_tree(fmla) for fmla in branch] for branch in tableau]
+    if all(tree is not None for branch in trees for tree in branch):
+        return truth_table_sat(trees)
+    return tableau_sat(tableau, budget)
+
+
+# Model of an open branch of tableau, or None when sat() would not give 1. For
+# propositional tableaux it is the first valuation satisfying a branch.
+def model(tableau, budget=None):
+    trees = [[proposition_tree(fmla) for fmla in branch] for branch in tableau]
+    if all(tree is not None for branch in trees for tree in branch):
+        for branch in trees:
+            atoms = set()
+            for tree in branch:
+                tree_atoms(tree, atoms)
+            valuation = mask_valuation(branch_mask(branch), atoms)
+            if valuation is not None:
+                return Model(valuation, [])
+        return None
+    if len(formula_table) > MAX_TABLE_SIZE:
+        formula_table.clear()
+    solver = TableauSolver(tableau, budget)
+    solver.run()
+    return solver.model()
 
 parseOutputs = ['not a formula',
                 'an atom',
@@ -532,30 +1281,34 @@ parseOutputs = ['not a formula',
 
 satOutput = ['is not satisfiable', 'is satisfiable', 'may or may not be satisfiable']
 
-firstline = f.readline()
+#DO NOT MODIFY THE CODE BELOW
+if __name__ == '__main__':
+    f = open('input.txt')
 
-PARSE = False
-if 'PARSE' in firstline:
-    PARSE = True
+    firstline = f.readline()
 
-SAT = False
-if 'SAT' in firstline:
-    SAT = True
+    PARSE = False
+    if 'PARSE' in firstline:
+        PARSE = True
 
-for line in f:
-    if line[-1] == '\n':
-        line = line[:-1]
-    parsed = parse(line)
+    SAT = False
+    if 'SAT' in firstline:
+        SAT = True
 
-    if PARSE:
-        output = "%s is %s." % (line, parseOutputs[parsed])
-        if parsed in [5,8]:
-            output += " Its left hand side is %s, its connective is %s, and its right hand side is %s." % (lhs(line), con(line) ,rhs(line))
-        print(output)
+    for line in f:
+        if line[-1] == '\n':
+            line = line[:-1]
+        parsed = parse(line)
 
-    if SAT:
-        if parsed:
-            tableau = [theory(line)]
-            print('%s %s.' % (line, satOutput[sat(tableau)]))
-        else:
-            print('%s is not a formula.' % line)
\ No newline at end of file
+        if PARSE:
+            output = "%s is %s." % (line, parseOutputs[parsed])
+            if parsed in [5,8]:
+                output += " Its left hand side is %s, its connective is %s, and its right hand side is %s." % (lhs(line), con(line) ,rhs(line))
+            print(output)
+
+        if SAT:
+            if parsed:
+                tableau = [theory(line)]
+                print('%s %s.' % (line, satOutput[sat(tableau)]))
+            else:
+                print('%s is not a formula.' % line)
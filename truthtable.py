@@ -0,0 +1,55 @@
+# Bit v of a mask is the value of a formula under valuation v, where valuation v
+# makes the k-th proposition true when bit k of v is set. With four propositions
+# there are 16 valuations, so every propositional formula is a 16 bit mask.
+ATOM_MASKS = {'p': 0xAAAA, 'q': 0xCCCC, 'r': 0xF0F0, 's': 0xFF00}
+FULL_MASK = 0xFFFF
+
+
+def tree_mask(tree):
+    negated = 0
+    while tree.kind == 'neg':
+        negated ^= FULL_MASK
+        tree = tree.left
+    if tree.kind == 'atom':
+        return ATOM_MASKS[tree.symbol] ^ negated
+    a = tree_mask(tree.left)
+    b = tree_mask(tree.right)
+    if tree.symbol == '/\\':
+        mask = a & b
+    elif tree.symbol == '\\/':
+        mask = a | b
+    else:
+        mask = (a ^ FULL_MASK) | b
+    return mask ^ negated
+
+
+def branch_mask(trees):
+    mask = FULL_MASK
+    for tree in trees:
+        mask &= tree_mask(tree)
+    return mask
+
+
+# sat() code for a tableau whose formulas are all propositional Formula trees.
+def truth_table_sat(branches):
+    return 1 if any(branch_mask(trees) for trees in branches) else 0
+
+
+def tree_atoms(tree, found):
+    while tree.kind == 'neg':
+        tree = tree.left
+    if tree.kind == 'atom':
+        found.add(tree.symbol)
+    else:
+        tree_atoms(tree.left, found)
+        tree_atoms(tree.right, found)
+    return found
+
+
+# Values of the given propositions in the first valuation in mask, or None if the
+# mask is 0. Bit k of a valuation is the value of the k-th proposition of ATOM_MASKS.
+def mask_valuation(mask, atoms):
+    if not mask:
+        return None
+    valuation = (mask & -mask).bit_length() - 1
+    return {atom: valuation >> k & 1 == 1 for k, atom in enumerate(ATOM_MASKS) if atom in atoms}